@@ -4,18 +4,28 @@
 #
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import json
 import logging
+import sys
 from optparse import OptionParser
 
 from wad import tools
-from wad.clues import Clues
-from wad.detection import TIMEOUT, Detector
+from wad.cache import CACHE_TTL, CACHE_MAX_SIZE, MEMO_SIZE, ResponseCache
+from wad.clues import CLUES_CACHE_DIR, Clues
+from wad.detection import TIMEOUT, WORKERS, PROCESSES, MAX_CONTENT_SIZE, MAX_READ_TIME, Detector
 from wad.group import group
-from wad.output import JSONOutput, CSVOutput, HumanReadableOutput
+from wad.guard import MATCH_TIMEOUT, regex_guard
+from wad.journal import Journal
+from wad.pool import MAX_CONNECTIONS
+from wad.profiling import PROFILE_TOP
+from wad.resolver import DNS_TTL, Resolver
+from wad.output import JSONOutput, JSONLinesOutput, CSVOutput, HumanReadableOutput
+from wad.scheduler import CONCURRENCY_PER_HOST, HOST_DELAY
 
 output_format_map = {
     'csv': CSVOutput,
     'json': JSONOutput,
+    'jsonl': JSONLinesOutput,
     'txt': HumanReadableOutput,
 }
 
@@ -50,11 +60,109 @@ etc."""
     parser.add_option("-c", "--clues", dest="clues_file", metavar="FILE", default=None,
                       help="clues for detecting web applications and technologies")
 
+    parser.add_option("--clues-cache", dest="clues_cache", metavar="DIR", default=CLUES_CACHE_DIR,
+                      help="directory for caching processed clues, to speed up startup (default: %s)" % CLUES_CACHE_DIR)
+
+    parser.add_option("--no-clues-cache", action="store_const", dest="clues_cache", const=None,
+                      help="don't cache processed clues")
+
     parser.add_option("-t", "--timeout", action="store", dest="TIMEOUT", default=timeout,
                       help="set timeout (in seconds) for accessing a single URL")
 
+    parser.add_option("-w", "--workers", action="store", dest="workers", default=WORKERS,
+                      help="number of URLs scanned concurrently (default: %d)" % WORKERS)
+
+    parser.add_option("-p", "--processes", action="store", dest="processes", default=PROCESSES,
+                      help="number of processes analyzing fetched pages, to use several CPU cores; "
+                           "0 means analyzing in the scanning threads (default: %d; thread engine only)" % PROCESSES)
+
+    parser.add_option("--engine", action="store", dest="engine", default='thread',
+                      help="scanning engine, allowed values: thread (default), asyncio (Python 3.6+; "
+                           "--workers is then the number of URLs fetched at the same time)")
+
+    parser.add_option("--host-concurrency", action="store", dest="host_concurrency", metavar="N",
+                      default=CONCURRENCY_PER_HOST,
+                      help="number of URLs scanned at the same time from a single host (default: %d)"
+                           % CONCURRENCY_PER_HOST)
+
+    parser.add_option("--host-delay", action="store", dest="host_delay", metavar="SECONDS", default=HOST_DELAY,
+                      help="minimum time between starting requests to a single host (default: %s)" % HOST_DELAY)
+
+    parser.add_option("--max-size", action="store", dest="max_size", metavar="BYTES", default=MAX_CONTENT_SIZE,
+                      help="only analyze this many first bytes of each page (default: %d)" % MAX_CONTENT_SIZE)
+
+    parser.add_option("--max-read-time", action="store", dest="max_read_time", metavar="SECONDS",
+                      default=MAX_READ_TIME,
+                      help="stop reading a page after this time, and only analyze what was read so far "
+                           "(default: %d)" % MAX_READ_TIME)
+
+    parser.add_option("--keep-alive", action="store_true", dest="keep_alive", default=False,
+                      help="reuse connections (and TLS sessions) for subsequent requests to the same host "
+                           "(thread engine only)")
+
+    parser.add_option("--max-connections", action="store", dest="max_connections", metavar="N",
+                      default=MAX_CONNECTIONS,
+                      help="with --keep-alive, number of idle connections kept per host (default: %d)"
+                           % MAX_CONNECTIONS)
+
+    parser.add_option("--resolve", action="store_true", dest="resolve", default=False,
+                      help="resolve hosts of all URLs (concurrently) before scanning, and connect to the resolved "
+                           "addresses; URLs of hosts which don't exist then fail immediately")
+
+    parser.add_option("--dns-ttl", action="store", dest="dns_ttl", metavar="SECONDS", default=DNS_TTL,
+                      help="with --resolve, keep resolved addresses for this long (default: %d)" % DNS_TTL)
+
+    parser.add_option("--match-timeout", action="store", dest="match_timeout", metavar="SECONDS",
+                      default=MATCH_TIMEOUT,
+                      help="clue patterns prone to catastrophic backtracking are matched in a separate process, "
+                           "and skipped if they take longer than this; 0 means no limit (default: %s)" % MATCH_TIMEOUT)
+
+    parser.add_option("--match-bytes", action="store_true", dest="match_bytes", default=False,
+                      help="match html clues on raw content of pages where it gives the same results, instead of "
+                           "decoding whole pages first, to use less memory (Python 3 only)")
+
+    parser.add_option("--profile-clues", action="store", dest="profile_top", metavar="N", default=None,
+                      help="measure time of matching each clue pattern, and after the scan print the N most "
+                           "expensive ones to STDERR (e.g. %d; not measured in processes of --processes)" % PROFILE_TOP)
+
+    parser.add_option("--timing", action="store_true", dest="timing", default=False,
+                      help="measure time spent in each phase of scanning each page (DNS, connect, TLS, first byte, "
+                           "body, decoding, each clue type, post-processing), add it to --metadata, and after the "
+                           "scan print a summary of it to STDERR; pages are then fetched with the connection pool "
+                           "of --keep-alive rather than urllib (connections aren't kept alive unless it's given), "
+                           "so redirections and proxies are handled by the pool")
+
+    parser.add_option("--metadata", dest="metadata_file", metavar="FILE",
+                      help="output file for metadata of scanned pages, e.g. whether their content was truncated")
+
+    parser.add_option("--cache", dest="cache_dir", metavar="DIR",
+                      help="cache successful, complete responses (and technologies detected in them) in this "
+                           "directory; cached responses are used instead of fetching pages again, and revalidated "
+                           "with the server once they are older than --cache-ttl (thread engine only)")
+
+    parser.add_option("--cache-ttl", action="store", dest="cache_ttl", metavar="SECONDS", default=CACHE_TTL,
+                      help="use cached responses without revalidating them for this long (default: %d)" % CACHE_TTL)
+
+    parser.add_option("--cache-max-size", action="store", dest="cache_max_size", metavar="BYTES",
+                      default=CACHE_MAX_SIZE,
+                      help="remove least recently used responses from the cache once it's bigger than this "
+                           "(default: %d)" % CACHE_MAX_SIZE)
+
+    parser.add_option("--memo-size", action="store", dest="memo_size", metavar="N", default=MEMO_SIZE,
+                      help="remember technologies detected in this many recently analyzed pages, and reuse them for "
+                           "identical pages (e.g. parked domains, default server pages); 0 disables it "
+                           "(default: %d)" % MEMO_SIZE)
+
+    parser.add_option("--journal", dest="journal_file", metavar="FILE",
+                      help="append results of each scanned URL to this file; URLs already in it aren't scanned "
+                           "again, but their results are included in the output (to resume an interrupted scan); "
+                           "URLs which failed (e.g. couldn't be fetched) are scanned again")
+
     parser.add_option("-f", "--format", action="store", dest="format", default='json',
-                      help="output format, allowed values: csv, txt, json (default)")
+                      help="output format, allowed values: csv, txt, json (default), jsonl (JSON Lines)")
+
+    parser.add_option("-s", "--stream", action="store_true", dest="stream", default=False,
+                      help="output results of each URL as soon as it is scanned, instead of all at the end")
 
     parser.add_option("-g", "--group", action="store_true", dest="group", default=False,
                       help="group results (i.e. technologies found on subpages of other scanned URL "
@@ -71,6 +179,7 @@ etc."""
         return
 
     timeout = int(options.TIMEOUT)
+    workers = int(options.workers)
 
     if options.urls[0] == "@":
         try:
@@ -88,14 +197,122 @@ etc."""
         parser.error("Invalid format specified")
         return
 
-    Clues.get_clues(options.clues_file)
+    if options.engine not in ['thread', 'asyncio']:
+        parser.error("Invalid engine specified")
+        return
+
+    if options.engine == 'asyncio' and sys.version_info < (3, 6):
+        parser.error("Asyncio engine requires Python 3.6+")
+        return
+
+    if (options.keep_alive or int(options.processes) > 0) and options.engine != 'thread':
+        parser.error("Keep-alive connections and matching processes can't be used with asyncio engine")
+        return
+
+    if options.stream and (options.group or options.engine != 'thread'):
+        parser.error("Streaming output can't be used with grouping or asyncio engine")
+        return
+
+    if options.cache_dir and options.engine != 'thread':
+        parser.error("Response cache can't be used with asyncio engine")
+        return
+
+    Clues.get_clues(options.clues_file, cache_dir=options.clues_cache)
 
-    results = Detector().detect_multiple(urls, limit=options.limit, exclude=options.exclude, timeout=timeout)
+    journal = None
+    if options.journal_file:
+        try:
+            journal = Journal(options.journal_file)
+        except (IOError, OSError) as e:
+            logging.error("Error opening journal file %s, terminating: %s", options.journal_file,
+                          tools.error_to_str(e))
+            return
+
+    detector_options = dict(max_content_size=int(options.max_size), max_read_time=float(options.max_read_time),
+                            collect_metadata=bool(options.metadata_file), memo_size=int(options.memo_size),
+                            resolver=Resolver(ttl=float(options.dns_ttl)) if options.resolve else None,
+                            profile=bool(options.profile_top), match_timeout=float(options.match_timeout),
+                            collect_timing=options.timing, match_bytes=options.match_bytes)
+    output_format = output_format_map[options.format]()
+
+    if options.engine == 'asyncio':
+        import asyncio
+        from wad.aio import AsyncDetector
+
+        detector = AsyncDetector(concurrency=workers, concurrency_per_host=int(options.host_concurrency),
+                                 host_delay=float(options.host_delay), **detector_options)
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(
+                detector.detect_multiple_async(urls, limit=options.limit, exclude=options.exclude, timeout=timeout,
+                                               journal=journal))
+        finally:
+            loop.close()
+    else:
+        cache = None
+        if options.cache_dir:
+            try:
+                cache = ResponseCache(options.cache_dir, ttl=float(options.cache_ttl),
+                                      max_size=int(options.cache_max_size))
+            except (IOError, OSError) as e:
+                logging.error("Error opening response cache %s, terminating: %s", options.cache_dir,
+                              tools.error_to_str(e))
+                return
+        detector = Detector(keep_alive=options.keep_alive, max_connections=int(options.max_connections),
+                            cache=cache, **detector_options)
+        if options.stream:
+            results = detector.detect_each(urls, limit=options.limit, exclude=options.exclude, timeout=timeout,
+                                           workers=workers, processes=int(options.processes), journal=journal,
+                                           host_concurrency=int(options.host_concurrency),
+                                           host_delay=float(options.host_delay))
+            try:
+                f = open(options.output_file, "w") if options.output_file else sys.stdout
+                output_format.stream(results, f)
+                if options.output_file:
+                    f.close()
+            except IOError as e:
+                logging.error("Error writing results to file %s, terminating: %s", options.output_file,
+                              tools.error_to_str(e))
+                return
+        else:
+            results = detector.detect_multiple(urls, limit=options.limit, exclude=options.exclude, timeout=timeout,
+                                               workers=workers, processes=int(options.processes), journal=journal,
+                                               host_concurrency=int(options.host_concurrency),
+                                               host_delay=float(options.host_delay))
+        if detector.pool:
+            detector.pool.close()
+
+    if journal is not None:
+        journal.close()
+
+    regex_guard.close()
+
+    if detector.profile is not None:
+        print(detector.profile.report(int(options.profile_top)), file=sys.stderr)
+
+    if detector.collect_timing:
+        print(detector.timing_summary(), file=sys.stderr)
+
+    if detector.memo is not None:
+        logging.info("Identical pages: findings reused %d times, computed %d times", detector.memo.hits,
+                     detector.memo.misses)
+
+    if options.metadata_file:
+        try:
+            f = open(options.metadata_file, "w")
+            json.dump(detector.metadata, f, indent=4)
+            f.close()
+        except Exception as e:
+            # an I/O exception?
+            logging.error("Error writing metadata to file %s: %s", options.metadata_file, tools.error_to_str(e))
+
+    if options.stream:
+        return
 
     if options.group:
         results = group(results)
 
-    output = output_format_map[options.format]().retrieve(results=results)
+    output = output_format.retrieve(results=results)
 
     if options.output_file:
         try:
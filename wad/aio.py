@@ -0,0 +1,249 @@
+# Asyncio-native detection (Python 3.6+ only)
+#
+# AsyncDetector fetches pages without blocking the event loop, and then analyzes them with the same methods
+# as Detector (findings, check_*, follow_implies etc.).
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import asyncio
+import http.client
+import io
+import logging
+import ssl
+import time
+import urllib.parse
+
+from wad import tools
+from wad.detection import TIMEOUT, CHUNK_SIZE, Detector, FetchError
+from wad.scheduler import CONCURRENCY_PER_HOST, HOST_DELAY
+from wad.timing import add_time, timed, timer
+
+CONCURRENCY = 100  # pages fetched at the same time
+MAX_REDIRECTIONS = 10
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class AsyncPage(object):
+    """
+    Fetched page, with the same accessors as responses of tools.urlopen()
+    """
+    def __init__(self, url, code, headers, content, truncated):
+        self.url = url
+        self.code = code
+        self.headers = headers
+        self.content = content
+        self.truncated = truncated
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+    def info(self):
+        return self.headers
+
+
+class AsyncDetector(Detector):
+    def __init__(self, concurrency=CONCURRENCY, concurrency_per_host=CONCURRENCY_PER_HOST, host_delay=HOST_DELAY,
+                 **kwargs):
+        super(AsyncDetector, self).__init__(**kwargs)
+        self.concurrency = concurrency
+        self.concurrency_per_host = concurrency_per_host
+        self.host_delay = host_delay
+        self.context = ssl._create_unverified_context()
+
+    async def detect_async(self, url, limit=None, exclude=None, timeout=TIMEOUT, raise_errors=False):
+        """
+        :param raise_errors: see Detector.detect
+        """
+        logging.info("- %s", url)
+
+        if not self.expected_url(url, limit, exclude):
+            return {}
+
+        # 'fetch' includes reading the body here, and connecting isn't timed separately (see wad.timing)
+        timing = {} if self.collect_timing else None
+        start = timer()
+        try:
+            with timed(timing, 'fetch'):
+                page = await self.fetch(url, timeout)
+        except (OSError, asyncio.TimeoutError, ValueError, FetchError) as e:
+            # a network problem? page unavailable? wrong URL?
+            logging.warning("Error opening %s, terminating: %s", url, tools.error_to_str(e) or type(e).__name__)
+            if raise_errors:
+                raise FetchError("Error opening %s: %s" % (url, tools.error_to_str(e) or type(e).__name__))
+            return {}
+
+        if page.code >= 400:
+            logging.warning("Error opening %s", url)
+
+        if page.url != url:
+            logging.info("` %s", page.url)
+
+            if not self.expected_url(page.url, limit, exclude):
+                return {}
+
+        url = self.normalize_url(page.url)
+        if page.truncated:
+            logging.info("Content of %s truncated to %d bytes", url, len(page.content))
+        if self.metadata is not None:
+            self.metadata[url] = {'size': len(page.content), 'truncated': page.truncated}
+
+        # matching is CPU-bound (and may wait for the matching pool or the regex guard), so it runs in a thread,
+        # without stalling other fetches
+        findings = await asyncio.get_event_loop().run_in_executor(None, self.analyze, page, url, page.content,
+                                                                  timing)
+        if timing is not None:
+            add_time(timing, 'total', timer() - start)
+            self.metadata[url]['timing'] = timing
+        return {url: findings}
+
+    async def detect_multiple_async(self, urls, limit=None, exclude=None, timeout=TIMEOUT, journal=None):
+        # remove duplicate URLs, remove empty URLs
+        urls = list(set(urls) - set([None, ""]))
+
+        results = {}
+        if journal is not None:
+            # see Detector.detect_each
+            for url in urls:
+                results.update(journal.done.get(url, {}))
+            urls = [url for url in urls if url not in journal.done]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        host_semaphores = {}
+
+        host_starts = {}
+        loop = asyncio.get_event_loop()
+
+        if self.resolver is not None:
+            urls = await loop.run_in_executor(None, self.resolve_hosts, urls, journal)
+
+        async def detect_limited(url):
+            host = urllib.parse.urlsplit(url).netloc.lower()
+            host_semaphore = host_semaphores.setdefault(host, asyncio.Semaphore(self.concurrency_per_host))
+            async with host_semaphore:
+                async with semaphore:
+                    # requests to the same host are started at least host_delay apart (reserved only now, so that
+                    # the delay isn't spent waiting for the global limit)
+                    start = max(loop.time(), host_starts.get(host, 0) + self.host_delay)
+                    host_starts[host] = start
+                    await asyncio.sleep(start - loop.time())
+                    try:
+                        res = await self.detect_async(url, limit, exclude, timeout, raise_errors=True)
+                    except FetchError as e:
+                        # see Detector.detect_safe
+                        if journal is not None:
+                            journal.record(url, {}, error=tools.error_to_str(e))
+                        return {}
+                    except Exception as e:
+                        logging.warning("Error detecting %s: %s", url, e)
+                        if journal is not None:
+                            journal.record(url, {}, error=tools.error_to_str(e))
+                        return {}
+                    if journal is not None:
+                        journal.record(url, res)
+                    return res
+
+        for res in await asyncio.gather(*[detect_limited(url) for url in urls]):
+            results.update(res)
+        return results
+
+    async def fetch(self, url, timeout):
+        for _ in range(MAX_REDIRECTIONS + 1):
+            code, headers, reader, writer = await asyncio.wait_for(self.request(url), timeout)
+            location = headers.get('Location')
+            if code in REDIRECT_CODES and location:
+                writer.close()
+                url = urllib.parse.urljoin(url, location)
+                continue
+
+            try:
+                content, truncated = await self.read_body(headers, reader, timeout)
+            finally:
+                writer.close()
+            return AsyncPage(url, code, headers, content, truncated)
+        raise FetchError("too many redirections")
+
+    async def request(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme not in ('http', 'https'):
+            raise FetchError("unknown url type: %s" % parsed.scheme)
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        host = parsed.hostname
+        if self.resolver is not None:
+            # cached, unless it's a new host (e.g. after a redirection)
+            addresses = await asyncio.get_event_loop().run_in_executor(None, self.resolver.resolve, host, port)
+            host = addresses[0][4][0]
+        if parsed.scheme == 'https':
+            reader, writer = await asyncio.open_connection(host, port, ssl=self.context,
+                                                           server_hostname=parsed.hostname)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+
+        path = urllib.parse.urlunsplit(('', '', parsed.path or '/', parsed.query, ''))
+        request = ["GET %s HTTP/1.1" % path, "Host: %s" % parsed.netloc.rsplit('@', 1)[-1],
+                   "Accept-Encoding: identity", "Connection: close"]
+        request += ["%s: %s" % header for header in tools.HEADERS.items()]
+        writer.write(("\r\n".join(request) + "\r\n\r\n").encode('latin-1'))
+
+        try:
+            status_line = await reader.readline()
+            code = int(status_line.split(None, 2)[1])
+            raw_headers = await reader.readuntil(b"\r\n\r\n")
+        except (IndexError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            raise FetchError("invalid response: %r" % status_line)
+        headers = http.client.parse_headers(io.BytesIO(raw_headers))
+        return code, headers, reader, writer
+
+    async def read_body(self, headers, reader, timeout):
+        """
+        :return: (content, True if it was truncated to max_content_size or max_read_time)
+        """
+        deadline = time.time() + self.max_read_time
+        chunks = []
+        size = 0
+
+        async def read(coroutine):
+            # each read is limited by timeout, and all of them together by the deadline
+            return await asyncio.wait_for(coroutine, max(0, min(timeout, deadline - time.time())))
+
+        def piece_size():
+            # no more than one byte over max_content_size is ever read, which tells that content was truncated
+            return min(CHUNK_SIZE, self.max_content_size + 1 - size)
+
+        async def parts():
+            if headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                while True:
+                    chunk_size = int((await read(reader.readline())).split(b';')[0], 16)
+                    if chunk_size == 0:
+                        return
+                    while chunk_size > 0:
+                        piece = await read(reader.readexactly(min(chunk_size, piece_size())))
+                        chunk_size -= len(piece)
+                        yield piece
+                    await read(reader.readexactly(2))
+            else:
+                length = headers.get('Content-Length')
+                remaining = int(length) if length and length.isdigit() else None
+                while remaining is None or remaining > 0:
+                    chunk = await read(reader.read(piece_size() if remaining is None else
+                                                   min(piece_size(), remaining)))
+                    if not chunk:
+                        return
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    yield chunk
+
+        try:
+            async for chunk in parts():
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > self.max_content_size:
+                    # there's more content than max_content_size
+                    return b''.join(chunks)[:self.max_content_size], True
+        except asyncio.TimeoutError:
+            if time.time() < deadline:
+                raise
+            return b''.join(chunks)[:self.max_content_size], True
+        return b''.join(chunks), False
@@ -0,0 +1,234 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import six
+
+from collections import OrderedDict
+from email.message import Message
+from hashlib import sha1
+import copy
+import io
+import logging
+import os
+import pickle
+import threading
+import time
+import zlib
+
+from wad import tools
+
+CACHE_TTL = 24 * 3600  # seconds for which a cached response is used without asking the server
+CACHE_MAX_SIZE = 512 * 1024 * 1024  # bytes of compressed responses kept in the cache directory
+# to be increased whenever the structure of cached responses changes
+CACHE_VERSION = 1
+# headers of a 304 Not Modified response which describe the response itself, not the cached one (RFC 7232 4.1)
+NOT_UPDATED_HEADERS = set(['content-length', 'content-encoding', 'transfer-encoding', 'content-range'])
+MEMO_SIZE = 1000  # findings of this many distinct pages are kept in memory
+
+
+class CachedPage(object):
+    """
+    Response loaded from the cache, with the same accessors as responses of tools.urlopen()
+    """
+    def __init__(self, entry, revalidated=False):
+        self.entry = entry
+        # True if the server confirmed (with 304 Not Modified) that the cached response is still valid
+        self.revalidated = revalidated
+        self.headers = Message()
+        for name, value in entry['headers']:
+            self.headers[name] = value
+        self.fp = io.BytesIO(entry['content'])
+
+    def geturl(self):
+        return self.entry['url']
+
+    def getcode(self):
+        return self.entry['code']
+
+    def info(self):
+        return self.headers
+
+    def read(self, amt=None):
+        return self.fp.read(amt)
+
+    def close(self):
+        pass
+
+
+class ResponseCache(object):
+    """
+    On-disk cache of responses (final URL, status code, headers, compressed content) and of findings detected
+    in them, keyed by the requested URL.
+
+    Only successful (2xx) responses, which weren't truncated, are cached. Responses younger than ttl are used
+    without contacting the server; older ones are revalidated with If-None-Match/If-Modified-Since (and updated
+    with headers of the 304 Not Modified response). Cached findings are reused as long as the clues don't change.
+    Least recently used responses are removed when the cache grows over max_size.
+    """
+    def __init__(self, directory, ttl=CACHE_TTL, max_size=CACHE_MAX_SIZE):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.sizes = {}  # file name -> size
+        for name in os.listdir(directory):
+            if name.endswith('.gz'):
+                self.sizes[name] = os.path.getsize(os.path.join(directory, name))
+        self.size = sum(self.sizes.values())
+
+    @staticmethod
+    def file_name(url):
+        return "%s.gz" % sha1(("%d %s" % (CACHE_VERSION, url)).encode('utf-8')).hexdigest()
+
+    def get(self, url):
+        """
+        :return: cached entry for the URL, None if there's none
+        """
+        path = os.path.join(self.directory, self.file_name(url))
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.loads(zlib.decompress(f.read()))
+            # the modification time is the last use, for evicting least recently used entries
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        except Exception as e:
+            logging.warning("Error while reading cached response for %s, ignoring it: %s", url,
+                            tools.error_to_str(e))
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry['time'] < self.ttl
+
+    @staticmethod
+    def validators(entry):
+        """
+        :return: headers for revalidating the entry with a conditional request
+        """
+        headers = {}
+        for name, value in entry['headers']:
+            if name.lower() == 'etag':
+                headers['If-None-Match'] = value
+            elif name.lower() == 'last-modified':
+                headers['If-Modified-Since'] = value
+        return headers
+
+    @staticmethod
+    def revalidated(entry, headers):
+        """
+        :param headers: (name, value) pairs of the 304 Not Modified response revalidating the entry
+        :return: copy of the entry, with its headers updated by those of the response
+        """
+        updated = dict((name.lower(), value) for name, value in headers
+                       if name.lower() not in NOT_UPDATED_HEADERS)
+        merged = [(name, value) for name, value in entry['headers'] if name.lower() not in updated]
+        merged += [(name, value) for name, value in headers if name.lower() in updated]
+        return dict(entry, headers=merged)
+
+    @staticmethod
+    def findings(page, digest):
+        """
+        :return: copy of findings cached for the page (CachedPage) if they were detected with clues of the given
+                 digest, None otherwise
+        """
+        if not isinstance(page, CachedPage) or page.entry.get('clues') != digest:
+            return None
+        return copy.deepcopy(page.entry['findings'])
+
+    def store(self, url, page, final_url, content, findings, digest):
+        if isinstance(page, CachedPage):
+            if not page.revalidated and page.entry.get('clues') == digest:
+                # nothing new
+                return
+            entry = dict(page.entry, findings=findings, clues=digest)
+            if page.revalidated:
+                entry['time'] = time.time()
+        elif not 200 <= page.getcode() < 300 or getattr(page, 'truncated', False):
+            # error pages may be temporary, and truncated content isn't the page; neither is used later
+            return
+        else:
+            entry = {
+                'url': final_url,
+                'code': page.getcode(),
+                'headers': list(page.info().items()),
+                'content': content,
+                'time': time.time(),
+                'findings': findings,
+                'clues': digest,
+            }
+
+        name = self.file_name(url)
+        path = os.path.join(self.directory, name)
+        data = zlib.compress(pickle.dumps(entry, protocol=2))
+        try:
+            # write to a temporary file first, so that concurrent readers never read a partial entry
+            temp_path = "%s.%d.%d" % (path, os.getpid(), threading.current_thread().ident)
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.rename(temp_path, path)
+        except (IOError, OSError) as e:
+            logging.warning("Error while caching response for %s: %s", url, tools.error_to_str(e))
+            return
+
+        with self.lock:
+            self.size += len(data) - self.sizes.get(name, 0)
+            self.sizes[name] = len(data)
+            if self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        # remove least recently used entries, until the cache is 10% below max_size (so that it isn't done
+        # again on the next store)
+        paths = dict((name, os.path.join(self.directory, name)) for name in self.sizes)
+        used = {}
+        for name, path in six.iteritems(paths):
+            try:
+                used[name] = os.path.getmtime(path)
+            except OSError:
+                used[name] = 0
+        for name in sorted(used, key=used.get):
+            if self.size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(paths[name])
+            except OSError:
+                pass
+            self.size -= self.sizes.pop(name)
+        logging.debug("Response cache evicted down to %d bytes", self.size)
+
+
+class FindingsMemo(object):
+    """
+    Bounded in-memory LRU cache of findings, keyed by a hash of everything they depend on (see
+    Detector.memo_key), so that pages identical to ones already analyzed (e.g. parked domains, default server pages)
+    are not matched against the clues again
+    """
+    def __init__(self, size=MEMO_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        :return: copy of memoized findings, None if there are none
+        """
+        with self.lock:
+            findings = self.entries.pop(key, None)
+            if findings is None:
+                self.misses += 1
+                return None
+            # moved to the end, as the most recently used
+            self.entries[key] = findings
+            self.hits += 1
+        return copy.deepcopy(findings)
+
+    def put(self, key, findings):
+        findings = copy.deepcopy(findings)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = findings
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
@@ -8,24 +8,217 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import threading
 import six
 
+from collections import deque
+from hashlib import sha1
+import itertools
 import os
 import logging
+import pickle
 import re
 import sre_constants
+import sre_parse
 import json
 
 from wad import tools
 
 CLUES_FILE_PATHS = [os.path.join(os.path.dirname(__file__), 'etc/apps.json'), '/etc/wad/apps.json']
+CLUES_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'wad')
+# to be increased whenever the structure of cached clues changes
+CLUES_CACHE_VERSION = 6
 clues_lock = threading.RLock()
 
+# shortest literal worth using as a trigger; shorter ones are present on almost every page
+MIN_TRIGGER_LENGTH = 3
+# classes which match the same characters in text decoded as latin-1 and in bytes (unlike e.g. \w and \s)
+BYTE_SAFE_CATEGORIES = set([sre_constants.CATEGORY_DIGIT, sre_constants.CATEGORY_NOT_DIGIT])
+
+
+class LazyRegexp(object):
+    """
+    Clue regexp, compiled the first time it's used: most clues are never searched, as their triggers aren't found
+    in scanned pages (see ClueTable), or their headers, cookies or meta tags aren't there. It's pickled (e.g. into
+    the clues cache) without the compiled regexp.
+    """
+    __slots__ = ('pattern', 'flags', 'compiled')
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+        self.compiled = None
+
+    def compile(self):
+        if self.compiled is None:
+            self.compiled = re.compile(self.pattern, self.flags)
+        return self.compiled
+
+    def search(self, *args):
+        return self.compile().search(*args)
+
+    def match(self, *args):
+        return self.compile().match(*args)
+
+    def __getstate__(self):
+        return self.pattern, self.flags
+
+    def __setstate__(self, state):
+        self.pattern, self.flags = state
+        self.compiled = None
+
+    def __eq__(self, other):
+        return isinstance(other, LazyRegexp) and (self.pattern, self.flags) == (other.pattern, other.flags)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.pattern, self.flags))
+
+    def __repr__(self):
+        return "LazyRegexp(%r, %r)" % (self.pattern, self.flags)
+
+
+class ClueTable(object):
+    """
+    Clues of one type (e.g. 'html') of all apps, flattened into a single table of (app, index, triggers) entries,
+    so that a text can be matched against all of them in one pass.
+
+    Triggers are lowercase literals, at least one of which the text must contain for the clue to match (None if no
+    such literals are known - then the clue is always a candidate). All triggers of the table are looked up in the
+    text at once, by a single regexp (see trigger_regexp).
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        self.untriggered = []
+        self.index = {}
+        self.triggers = {}
+        for pos, (app, i, triggers) in enumerate(entries):
+            self.triggers[(app, i)] = triggers
+            if triggers is None:
+                self.untriggered.append(pos)
+            else:
+                for trigger in triggers:
+                    self.index.setdefault(trigger, []).append(pos)
+        # a found trigger stands for all triggers which are its prefixes too (see trigger_regexp)
+        self.found_index = dict((trigger, sorted(set(pos for end in range(1, len(trigger) + 1)
+                                                     for pos in self.index.get(trigger[:end], []))))
+                                for trigger in self.index)
+        # the same for raw content; triggers are ASCII, so lowercase bytes contain them iff lowercase text does
+        self.bytes_found_index = dict((trigger.encode('ascii'), positions)
+                                      for trigger, positions in six.iteritems(self.found_index))
+        # compiled on first use, as most tables of a scan are never used for some kinds of texts (e.g. raw content)
+        self.regexps = {}
+
+    @staticmethod
+    def trigger_regexp(triggers):
+        """
+        :return: regexp finding, at every position of a text, the longest of triggers starting there; triggers are
+                 arranged in a trie, so that each position is looked at once for all of them
+        """
+        trie = {}
+        for trigger in triggers:
+            node = trie
+            for char in trigger:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        def alternatives(node):
+            branches = [re.escape(char) + alternatives(node[char]) for char in sorted(node) if char]
+            if not branches:
+                return ''
+            regexp = branches[0] if len(branches) == 1 else '(?:%s)' % '|'.join(branches)
+            # a trigger ending here, unless a longer one matches
+            return '(?:%s)?' % regexp if '' in node else regexp
+
+        return '(?=(%s))' % alternatives(trie)
+
+    def candidates(self, text):
+        """
+        :param text: text, or raw content (bytes) to be matched by bytes regexps
+        """
+        raw = six.PY3 and isinstance(text, bytes)
+        hits = set(self.untriggered)
+        if self.index:
+            regexp = self.regexps.get(raw)
+            if regexp is None:
+                pattern = self.trigger_regexp(self.index)
+                regexp = self.regexps[raw] = re.compile(pattern.encode('ascii') if raw else pattern)
+            found_index = self.bytes_found_index if raw else self.found_index
+            for trigger in set(regexp.findall(text.lower())):
+                hits.update(found_index[trigger])
+        return [self.entries[pos][:2] for pos in sorted(hits)]
+
+    def is_candidate(self, app, i, text):
+        # the same as (app, i) in self.candidates(text), for a single clue
+        triggers = self.triggers[(app, i)]
+        if triggers is None:
+            return True
+        lowered = text.lower()
+        return any(trigger in lowered for trigger in triggers)
+
+
+class AppRelations(object):
+    """
+    Implies and excludes of all apps, resolved into tables indexed by app number: for each app, all apps it
+    implies, directly or not (nearest first), and all apps it excludes - so that following them is a single
+    lookup per finding. Apps referenced but not defined in clues are left out.
+    """
+    def __init__(self, apps):
+        self.names = sorted(apps)
+        self.index = dict((app, i) for i, app in enumerate(self.names))
+        direct = [self.indexes(apps, app, 'implies') for app in self.names]
+        self.implies = [self.closure(direct, i) for i in range(len(self.names))]
+        self.excludes = [self.indexes(apps, app, 'excludes') for app in self.names]
+
+    def indexes(self, apps, app, key):
+        indexes = []
+        for other in apps[app].get(key, []):
+            if other in self.index:
+                indexes.append(self.index[other])
+            else:
+                logging.debug("Unknown app %s in %s of %s, ignoring it", other, key, app)
+        return tuple(indexes)
+
+    @staticmethod
+    def closure(direct, i):
+        # breadth-first, through implies of implied apps
+        found = []
+        seen = set([i])
+        queue = deque(direct[i])
+        while queue:
+            j = queue.popleft()
+            if j not in seen:
+                seen.add(j)
+                found.append(j)
+                queue.extend(direct[j])
+        return tuple(found)
+
 
 class _Clues(object):
     def __init__(self):
         self.apps = None
         self.categories = None
+        self.tables = None
+        self.keyed_tables = None
+        self.relations = None
+        # clue patterns prone to catastrophic backtracking, as (app, key, index or name), and their compiled regexps
+        # (matched with a time limit, see wad.guard)
+        self.risky = None
+        self.risky_regexps = None
+        # compiled html clue regexps -> the same compiled for matching raw content (see get_bytes_regexps)
+        self.bytes_regexps = None
+        # compiled script clue regexps -> the same compiled for matching all script sources of a page at once,
+        # joined as lines of a single text (see joinable)
+        self.joined_regexps = None
+        self.digest = None
+        self.filename = None
+        self.cache_dir = None
 
-    def get_clues(self, filename=None):
+    def get_clues(self, filename=None, cache_dir=None):
+        """
+        :param filename: clues file (default: first existing file from CLUES_FILE_PATHS)
+        :param cache_dir: if given, normalized clues are cached in this directory, and loaded from there as long as
+                          the clues files don't change
+        """
         with clues_lock:
             if self.apps and self.categories:
                 return self.apps, self.categories
@@ -35,10 +228,82 @@ class _Clues(object):
                     if os.path.isfile(clues_path):
                         filename = clues_path
                         break
-            self.load_clues(filename)
-            self.compile_clues()
+
+            self.filename, self.cache_dir = filename, cache_dir
+            self.digest = self.clues_digest(filename)
+            cache_file = (os.path.join(cache_dir, "%s%s.pickle" % (self.cache_prefix(filename), self.digest))
+                          if cache_dir else None)
+
+            if not (cache_file and self.load_cache(cache_file)):
+                self.load_clues(filename)
+                self.compile_clues()
+                if cache_file:
+                    self.save_cache(cache_file)
+            self.log_risky_patterns()
             return self.apps, self.categories
 
+    @staticmethod
+    def cache_prefix(filename):
+        # caches of each clues file are named apart, so that scans using different clues files share the cache
+        # directory without removing each other's caches
+        return "clues-%s-" % sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()[:12]
+
+    @staticmethod
+    def code_digest():
+        # hash of this module, which normalizes clues and builds the cached tables: cached clues are rebuilt when
+        # it changes, also if CLUES_CACHE_VERSION isn't increased
+        path = os.path.splitext(__file__)[0] + '.py'
+        with open(path if os.path.isfile(path) else __file__, 'rb') as f:
+            return sha1(f.read()).digest()
+
+    @classmethod
+    def clues_digest(cls, filename):
+        # content hash of the clues files, identifying the version of the clues database
+        digest = sha1(("%d-%d" % (CLUES_CACHE_VERSION, six.PY3)).encode('utf-8'))
+        digest.update(cls.code_digest())
+        for path in [filename, filename + ".other"]:
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+    def load_cache(self, cache_file):
+        """
+        :return: True if normalized clues were loaded from the cache file, False if it's missing or broken
+        """
+        if not os.path.isfile(cache_file):
+            return False
+        try:
+            with open(cache_file, 'rb') as f:
+                (self.apps, self.categories, self.tables, self.keyed_tables, self.relations, self.risky,
+                 self.risky_regexps, self.joined_regexps) = pickle.load(f)
+            self.bytes_regexps = None
+        except Exception as e:
+            logging.warning("Error while reading clues cache %s, ignoring it: %s", cache_file, tools.error_to_str(e))
+            return False
+        logging.info("Clues loaded from cache %s", cache_file)
+        return True
+
+    def save_cache(self, cache_file):
+        # clue regexps are pickled without being compiled (see LazyRegexp), and compiled again when first used
+        cache_dir = os.path.dirname(cache_file)
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            # write to a temporary file first, so that concurrent processes never read a partial cache
+            temp_file = "%s.%d" % (cache_file, os.getpid())
+            with open(temp_file, 'wb') as f:
+                pickle.dump((self.apps, self.categories, self.tables, self.keyed_tables, self.relations, self.risky,
+                             self.risky_regexps, self.joined_regexps), f, protocol=2)
+            os.rename(temp_file, cache_file)
+            # remove caches of older versions of the same clues file
+            prefix = self.cache_prefix(self.filename)
+            for name in os.listdir(cache_dir):
+                if name.startswith(prefix) and name.endswith(".pickle") and name != os.path.basename(cache_file):
+                    os.remove(os.path.join(cache_dir, name))
+        except (IOError, OSError) as e:
+            logging.warning("Error while writing clues cache %s: %s", cache_file, tools.error_to_str(e))
+
     @staticmethod
     def read_clues_from_file(filename):
         logging.info("Reading clues file %s", filename)
@@ -114,7 +379,10 @@ class _Clues(object):
     @staticmethod
     def compile_clue(regexp_extended):
         values = regexp_extended.split(r'\;')
-        regex_dict = {"re": re.compile(values[0], flags=re.IGNORECASE)}
+        regex_dict = {"re": LazyRegexp(values[0], flags=re.IGNORECASE)}
+        # compiled right away (when clues are processed, not when they're loaded from the cache), so that invalid
+        # regexps are found
+        regex_dict["re"].compile()
         for extra_field in values[1:]:
             try:
                 (k, v) = extra_field.split(':', 1)
@@ -125,7 +393,16 @@ class _Clues(object):
         return regex_dict
 
     def compile_clues(self):
+        self.find_risky_patterns()
+        self.compile_regexps()
+        self.build_tables()
+        self.relations = AppRelations(self.apps)
+
+    def compile_regexps(self):
         # compiling regular expressions
+        self.risky_regexps = set()
+        self.bytes_regexps = None
+        self.joined_regexps = {}
         for app in self.apps:
             regexps = {}
             for key in list(self.apps[app]):
@@ -140,7 +417,235 @@ class _Clues(object):
                                                     for entry in self.apps[app][key])
                     except sre_constants.error:
                         del self.apps[app][key]
+            for key in regexps:
+                entries = regexps[key] if isinstance(regexps[key], dict) else dict(enumerate(regexps[key]))
+                for entry, regex_dict in six.iteritems(entries):
+                    if (app, key[:-len("_re")], entry) in self.risky:
+                        self.risky_regexps.add(regex_dict["re"])
+                    elif key == 'script_re':
+                        self.add_joined_regexp(regex_dict["re"])
             self.apps[app].update(regexps)
 
+    def log_risky_patterns(self):
+        # (not when they're found, so that they're also logged when clues are loaded from the cache)
+        for app, key, entry in sorted(self.risky, key=lambda risky: (risky[0], risky[1], str(risky[2]))):
+            if key + '_re' in self.apps[app]:
+                logging.info("Clue of %s (%s) has nested quantifiers, and will be matched with a time limit: %s",
+                             app, key, self.apps[app][key + '_re'][entry]["re"].pattern)
+
+    @classmethod
+    def nested_quantifiers(cls, parsed, in_repeat=False):
+        """
+        :param parsed: regexp parsed with sre_parse
+        :return: True if there's an unbounded repeat inside another repeat, e.g. (a+)+ or (?:[^/]+/)*, which may
+                 take exponential time on texts almost matching it (catastrophic backtracking)
+        """
+        for op, av in parsed:
+            if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                if in_repeat and av[1] == sre_constants.MAXREPEAT:
+                    return True
+                if cls.nested_quantifiers(av[2], in_repeat or av[1] > 1):
+                    return True
+            elif op == sre_constants.SUBPATTERN:
+                if cls.nested_quantifiers(av[-1], in_repeat):
+                    return True
+            elif op == sre_constants.BRANCH:
+                if any(cls.nested_quantifiers(branch, in_repeat) for branch in av[1]):
+                    return True
+            elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+                if cls.nested_quantifiers(av[1], in_repeat):
+                    return True
+        return False
+
+    @classmethod
+    def byte_safe(cls, parsed):
+        """
+        :param parsed: regexp parsed with sre_parse
+        :return: True if the regexp matches raw content in the same way as the content decoded as latin-1: it has
+                 no non-ASCII characters (case-insensitive matching of which differs), and no \\w, \\s, \\b etc.
+                 (which are ASCII-only for bytes)
+        """
+        for op, av in parsed:
+            if op in (sre_constants.LITERAL, sre_constants.NOT_LITERAL):
+                if av > 127:
+                    return False
+            elif op == sre_constants.IN:
+                for item_op, item_av in av:
+                    if ((item_op == sre_constants.LITERAL and item_av > 127) or
+                            (item_op == sre_constants.RANGE and item_av[1] > 127) or
+                            (item_op == sre_constants.CATEGORY and item_av not in BYTE_SAFE_CATEGORIES)):
+                        return False
+            elif op == sre_constants.AT:
+                if av in (sre_constants.AT_BOUNDARY, sre_constants.AT_NON_BOUNDARY):
+                    return False
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                if not cls.byte_safe(av[2]):
+                    return False
+            elif op == sre_constants.SUBPATTERN:
+                if not cls.byte_safe(av[-1]):
+                    return False
+            elif op == sre_constants.BRANCH:
+                if not all(cls.byte_safe(branch) for branch in av[1]):
+                    return False
+            elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+                if not cls.byte_safe(av[1]):
+                    return False
+            elif op == sre_constants.GROUPREF_EXISTS:
+                if not all(cls.byte_safe(branch) for branch in av[1:] if branch is not None):
+                    return False
+        return True
+
+    @classmethod
+    def joinable(cls, parsed):
+        """
+        :param parsed: regexp parsed with sre_parse
+        :return: True if the regexp (compiled with re.MULTILINE) matches a line of a text joined from lines whenever
+                 it matches the line alone: it has no lookarounds (which would see the neighbouring lines) and no
+                 \\A, \\Z (^ and $ match at the ends of lines then)
+        """
+        for op, av in parsed:
+            if op == sre_constants.AT:
+                if av in (sre_constants.AT_BEGINNING_STRING, sre_constants.AT_END_STRING):
+                    return False
+            elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+                return False
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                if not cls.joinable(av[2]):
+                    return False
+            elif op == sre_constants.SUBPATTERN:
+                if not cls.joinable(av[-1]):
+                    return False
+            elif op == sre_constants.BRANCH:
+                if not all(cls.joinable(branch) for branch in av[1]):
+                    return False
+            elif op == sre_constants.GROUPREF_EXISTS:
+                if not all(cls.joinable(branch) for branch in av[1:] if branch is not None):
+                    return False
+        return True
+
+    def add_joined_regexp(self, regexp):
+        try:
+            if not self.joinable(sre_parse.parse(regexp.pattern)):
+                return
+        except sre_constants.error:
+            return
+        joined = regexp
+        if '^' in regexp.pattern or '$' in regexp.pattern:
+            joined = LazyRegexp(regexp.pattern, flags=regexp.flags | re.MULTILINE)
+        self.joined_regexps[regexp] = joined
+
+    def get_bytes_regexps(self):
+        """
+        Compiles html clues for matching raw content (bytes) the first time it's needed, the ones which match it in
+        the same way as the decoded content (see byte_safe)
+        :return: dict of compiled html clue regexps -> the same regexps compiled for bytes
+        """
+        with clues_lock:
+            if self.bytes_regexps is None:
+                bytes_regexps = {}
+                for app in self.apps:
+                    for clue, regex_dict in zip(self.apps[app].get('html', []), self.apps[app].get('html_re', [])):
+                        pattern = clue.split(r'\;')[0]
+                        try:
+                            if not self.byte_safe(sre_parse.parse(pattern)):
+                                continue
+                            bytes_re = re.compile(pattern.encode('ascii'), flags=re.IGNORECASE)
+                        except (sre_constants.error, UnicodeError):
+                            continue
+                        bytes_regexps[regex_dict['re']] = bytes_re
+                        if regex_dict['re'] in self.risky_regexps:
+                            self.risky_regexps.add(bytes_re)
+                logging.info("%d html clues are matched on raw content", len(bytes_regexps))
+                self.bytes_regexps = bytes_regexps
+            return self.bytes_regexps
+
+    def find_risky_patterns(self):
+        self.risky = set()
+        for app in self.apps:
+            for key in ['script', 'html', 'url', 'meta', 'headers', 'cookies']:
+                clues = self.apps[app].get(key, [])
+                entries = clues if isinstance(clues, dict) else dict(enumerate(clues))
+                for entry, clue in six.iteritems(entries):
+                    try:
+                        risky = self.nested_quantifiers(sre_parse.parse(clue.split(r'\;')[0]))
+                    except sre_constants.error:
+                        continue
+                    if risky:
+                        self.risky.add((app, key, entry))
+
+    def build_tables(self):
+        self.tables = dict((key, self.build_table(key)) for key in ['script', 'html', 'url'])
+        self.keyed_tables = {
+            'headers': self.build_keyed_table('headers', lower=True),
+            'cookies': self.build_keyed_table('cookies', lower=False),
+            'meta': self.build_keyed_table('meta', lower=True),
+        }
+
+    @staticmethod
+    def better_literals(literals1, literals2):
+        # prefer literals whose shortest element is longer, then fewer alternatives
+        def score(literals):
+            return (min(len(x) for x in literals), -len(literals)) if literals else (0, 0)
+        return literals2 if score(literals2) > score(literals1) else literals1
+
+    @classmethod
+    def required_literals(cls, parsed):
+        """
+        :param parsed: regexp parsed with sre_parse
+        :return: tuple of lowercase literals, at least one of which is present in any text matched by the regexp
+                 (empty tuple if no such literals were found)
+        """
+        # non-ASCII characters are left out, as their case folding may differ from str.lower()
+        best = ()
+        literal = ''
+        for op, av in list(parsed) + [(None, None)]:
+            if op == sre_constants.LITERAL and av < 128:
+                literal += chr(av)
+                continue
+
+            found = []
+            if literal:
+                found.append((literal.lower(),))
+                literal = ''
+            if op == sre_constants.SUBPATTERN:
+                found.append(cls.required_literals(av[-1]))
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+                found.append(cls.required_literals(av[2]))
+            elif op == sre_constants.BRANCH:
+                alternatives = [cls.required_literals(branch) for branch in av[1]]
+                if all(alternatives):
+                    found.append(tuple(sorted(set(itertools.chain(*alternatives)))))
+
+            for literals in found:
+                best = cls.better_literals(best, literals)
+        return best
+
+    @classmethod
+    def clue_triggers(cls, regexp):
+        try:
+            literals = cls.required_literals(sre_parse.parse(regexp))
+        except sre_constants.error:
+            return None
+        if not literals or min(len(x) for x in literals) < MIN_TRIGGER_LENGTH:
+            return None
+        return literals
+
+    def build_table(self, key):
+        entries = []
+        for app in self.apps:
+            if key in self.apps[app]:
+                for i, clue in enumerate(self.apps[app][key]):
+                    entries.append((app, i, self.clue_triggers(clue.split(r'\;')[0])))
+        return ClueTable(entries)
+
+    def build_keyed_table(self, key, lower):
+        # inverted index of clues keyed by name, e.g. for headers: lowercase header name -> [(app, header), ...]
+        table = {}
+        for app in self.apps:
+            if key in self.apps[app]:
+                for entry in self.apps[app][key]:
+                    table.setdefault(entry.lower() if lower else entry, []).append((app, entry))
+        return table
+
 
 Clues = _Clues()  # For use as singleton
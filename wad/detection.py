@@ -2,38 +2,185 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import six
 
 from _ssl import SSLError
-import copy
+from email.message import Message
+from hashlib import sha1
+from multiprocessing.pool import ThreadPool
+import bisect
 import logging
 import socket
 import re
+import time
 
 from wad import tools
+from wad.cache import MEMO_SIZE, CachedPage, FindingsMemo
 from wad.clues import Clues
-
-# TODO: Switch to BeautifulSoup or lxml for HTML parsing purposes
-re_meta = re.compile(r'<meta[^>]+>', re.IGNORECASE)
-re_content = re.compile(r'content\s*=\s*[\'"]([^\'"]+)[\'"]', re.IGNORECASE)
-re_name = re.compile(r'name\s*=\s*[\'"]([^\'"]+)[\'"]', re.IGNORECASE)
-re_script = re.compile(r'<script[^>]+src\s*=\s*["\']([^"\']*)', re.IGNORECASE)
+from wad.finding import Finding
+from wad.page import HtmlPage
+from wad.guard import MATCH_TIMEOUT, GuardedPool, MatchTimeout, regex_guard
+from wad.pool import MAX_CONNECTIONS, ConnectionPool
+from wad.profiling import ClueProfile
+from wad.scheduler import CONCURRENCY_PER_HOST, HOST_DELAY, HostScheduler
+from wad.timing import add_time, summary, timed
 
 TIMEOUT = 3
+WORKERS = 1
+PROCESSES = 0
+MAX_CONTENT_SIZE = 5 * 1024 * 1024  # only this many first bytes of each page are matched
+MAX_READ_TIME = 30  # seconds for reading the content of a single page
+CHUNK_SIZE = 64 * 1024
+
+
+# Detector used by processes of the matching pool, see Detector.detect_multiple
+matching_detector = None
+
+
+def init_matching_process(clues_file, clues_cache_dir, detector_class=None, options=None):
+    """
+    :param detector_class: class of the scanning detector (Detector by default), so that its checks are used
+    :param options: keyword arguments of detector_class for settings of matching, e.g. {'match_bytes': True}
+    """
+    global matching_detector
+    Clues.get_clues(clues_file, cache_dir=clues_cache_dir)
+    # identical pages are already recognized by the memo of the scanning process
+    matching_detector = (detector_class or Detector)(memo_size=0, collect_metadata=False, **(options or {}))
+
+
+def match_page(url, headers, content):
+    """
+    Runs in a process of the matching pool
+    :param headers: list of (name, value) pairs
+    :param content: raw (not decoded) content
+    :return: findings
+    """
+    message = Message()
+    for name, value in headers:
+        message[name] = value
+    if six.PY3 and not matching_detector.match_bytes:
+        content = content.decode('latin-1')
+    return matching_detector.findings(url, message, content)
+
+
+class FetchError(Exception):
+    """
+    Page couldn't be fetched, or its content couldn't be read (the cause is logged where it happens)
+    """
+    pass
+
+
+class DecodedMatch(object):
+    """
+    Match of a bytes regexp in raw content, giving matched parts decoded as latin-1 - the same as a match of
+    the text regexp in the decoded content
+    """
+    def __init__(self, match):
+        self.match = match
+
+    def group(self, index=0):
+        group = self.match.group(index)
+        return group.decode('latin-1') if group is not None else None
+
+    def expand(self, template):
+        return self.match.expand(template.encode('latin-1')).decode('latin-1')
 
 
 class Detector(object):
-    def __init__(self):
+    def __init__(self, max_content_size=MAX_CONTENT_SIZE, max_read_time=MAX_READ_TIME, keep_alive=False,
+                 max_connections=MAX_CONNECTIONS, collect_metadata=True, cache=None, memo_size=MEMO_SIZE,
+                 resolver=None, profile=False, match_timeout=MATCH_TIMEOUT, collect_timing=False,
+                 match_bytes=False):
         self.apps, self.categories = Clues.get_clues()
-
-    def detect(self, url, limit=None, exclude=None, timeout=TIMEOUT):
+        self.tables = Clues.tables
+        self.keyed_tables = Clues.keyed_tables
+        self.relations = Clues.relations
+        self.risky_regexps = Clues.risky_regexps
+        self.joined_regexps = Clues.joined_regexps
+        self.max_content_size = max_content_size
+        self.max_read_time = max_read_time
+        # optional wad.resolver.Resolver: hosts are resolved in advance, and pages fetched from cached addresses
+        self.resolver = resolver
+        # with keep_alive, connections (and TLS sessions) are reused for subsequent requests to the same host
+        self.pool = None
+        # with collect_timing, pages are fetched with the pool too, as its connections time each phase of connecting
+        if keep_alive or resolver is not None or collect_timing:
+            self.pool = ConnectionPool(max_connections if keep_alive else 0, resolver)
+            reasons = [reason for reason, used in [('keep-alive', keep_alive), ('resolver', resolver is not None),
+                                                   ('timing', collect_timing)] if used]
+            logging.info("Pages are fetched with connections of wad.pool (for %s), not urllib", ', '.join(reasons))
+        # additional information about scanned pages, e.g. {url: {'size': 1234, 'truncated': False}}
+        # (not collected if collect_metadata is False, to keep memory usage constant in long scans)
+        self.metadata = {} if collect_metadata or collect_timing else None
+        # with collect_timing, time spent in each phase of scanning a page is added to its metadata,
+        # e.g. {url: {'size': 1234, 'truncated': False, 'timing': {'dns': 0.002, ..., 'total': 0.351}}}
+        # (see wad.timing)
+        self.collect_timing = collect_timing
+        # if set, findings are computed by this pool of processes
+        self.matching_pool = None
+        # optional wad.cache.ResponseCache, for not fetching (or analyzing) unchanged pages again
+        self.cache = cache
+        # findings of recently analyzed pages, reused for identical pages (None if memo_size is 0)
+        self.memo = FindingsMemo(memo_size) if memo_size > 0 else None
+        # time limit for matching clue patterns prone to catastrophic backtracking (0 means no limit)
+        self.match_timeout = match_timeout
+        # with match_bytes, html clues are matched on raw content where it gives the same results (see
+        # wad.clues._Clues.get_bytes_regexps), so that the whole content is only decoded if other clues are
+        # triggered by it, and otherwise only matched parts are (Python 3 only: on Python 2, content isn't decoded)
+        self.match_bytes = match_bytes and six.PY3
+        self.bytes_regexps = Clues.get_bytes_regexps() if self.match_bytes else {}
+        # with profile, statistics of matching each clue pattern are collected (in the scanning process only, not
+        # in the matching processes); otherwise check_clue isn't wrapped at all, so that there's no overhead
+        self.profile = None
+        if profile:
+            self.profile = ClueProfile()
+            self.check_clue = self.profiled_check_clue
+
+    def detect(self, url, limit=None, exclude=None, timeout=TIMEOUT, raise_errors=False):
+        """
+        :param raise_errors: if set, FetchError is raised if the page can't be fetched, instead of returning {}
+        """
         logging.info("- %s", url)
 
+        timing = {} if self.collect_timing else None
+        with timed(timing, 'total'):
+            try:
+                fetched = self.fetch(url, limit, exclude, timeout, timing)
+            except FetchError:
+                if raise_errors:
+                    raise
+                return {}
+            if fetched is None:
+                return {}
+            page, final_url, content = fetched
+
+            findings = None
+            if self.cache is not None:
+                findings = self.cache.findings(page, Clues.digest)
+            if findings is None:
+                findings = self.analyze(page, final_url, content, timing)
+            if self.cache is not None:
+                self.cache.store(url, page, final_url, content, findings, Clues.digest)
+
+        if timing is not None:
+            self.metadata.setdefault(final_url, {})['timing'] = timing
+        return {final_url: findings}
+
+    def fetch(self, url, limit=None, exclude=None, timeout=TIMEOUT, timing=None):
+        """
+        :return: (page, final normalized URL, raw content), or None if the page shouldn't be analyzed
+        :raise FetchError: if the page can't be fetched
+        """
         original_url = url
 
         if not self.expected_url(url, limit, exclude):
-            return {}
+            return None
 
-        page = self.get_page(url=url, timeout=timeout)
+        with timed(timing, 'fetch'):
+            page = self.get_page(url=url, timeout=timeout)
         if not page:
-            return {}
+            raise FetchError("Error opening %s" % url)
+        if timing is not None:
+            # phases of connecting, timed by connections of the pool
+            for phase, seconds in six.iteritems(getattr(page, 'timing', {})):
+                add_time(timing, phase, seconds)
 
         url = self.get_new_url(page)
 
@@ -41,77 +188,291 @@ class Detector(object):
             logging.info("` %s", url)
 
             if not self.expected_url(url, limit, exclude):
-                return {}
+                return None
 
         url = self.normalize_url(url)
 
-        content = self.get_content(page, url)
+        with timed(timing, 'body'):
+            content = self.get_content(page, url)
         if content is None:  # Empty content is empty string, so it will pass.
-            return {}
-
-        if six.PY3:
-            content = content.decode('latin-1')
+            raise FetchError("Error reading %s" % url)
 
-        findings = self.findings(url, page.info(), content)
-        findings += self.additional_checks(page, url, content)
+        return page, url, content
 
-        return {url: findings}
+    def analyze(self, page, url, content, timing=None):
+        """
+        :param content: raw (not decoded) content
+        :param timing: optional dict, to which time spent in each phase is added (see wad.timing)
+        :return: findings
+        """
+        headers = page.info()
+        if self.match_bytes:
+            text = content
+        else:
+            with timed(timing, 'decode'):
+                text = content.decode('latin-1') if six.PY3 else content
+
+        findings = None
+        with timed(timing, 'matching'):
+            if self.memo is not None:
+                key = self.memo_key(url, headers, content)
+                findings = self.memo.get(key)
+            if findings is None:
+                if self.matching_pool is not None:
+                    # raw content is sent to the matching process, and decoded there
+                    findings = self.matching_pool.apply(match_page, (url, list(headers.items()), content))
+                else:
+                    findings = self.findings(url, headers, text, timing)
+                if self.memo is not None:
+                    self.memo.put(key, findings)
+
+        with timed(timing, 'post_processing'):
+            findings = self.materialize(findings)
+            if self.match_bytes and type(self).additional_checks is not Detector.additional_checks:
+                # additional checks of subclasses get the decoded content, as always
+                text = content.decode('latin-1')
+            findings += self.additional_checks(page, url, text)
+        return findings
 
-    def findings(self, url, headers, content):
+    def memo_key(self, url, headers, content):
+        """
+        :param content: raw (not decoded) content
+        :return: hash of everything findings() depend on: clues matching headers and cookies (as seen by
+                 check_headers and check_cookies), content, URL clues matching the URL, and clues themselves
+        """
+        # matches rather than values, so that e.g. random session IDs don't make pages different
+        header_matches, cookie_matches = [], []
+        if headers:
+            header_matches = self.keyed_matches('headers', dict((k.lower(), v) for k, v in headers.items()))
+            cookie_matches = self.keyed_matches('cookies', self.parse_cookies(headers))
+        url_matches = []
+        for app, i in self.tables['url'].candidates(url):
+            match = self.apps[app]['url_re'][i]['re'].search(url)
+            if match:
+                url_matches.append((app, i, match.groups()))
+        key = sha1(repr((header_matches, cookie_matches, url_matches, Clues.digest)).encode('utf-8'))
+        key.update(content)
+        return key.digest()
+
+    def keyed_matches(self, key, values):
+        """
+        :param values: dict of name -> value, e.g. of headers
+        :return: sorted (name, app, entry, groups) of clues of given type (e.g. 'headers') matching the values
+        """
+        matches = []
+        for name, value in six.iteritems(values):
+            for app, entry in self.keyed_tables[key].get(name, []):
+                match = self.apps[app][key + '_re'][entry]['re'].search(value)
+                if match:
+                    matches.append((name, app, entry, match.groups()))
+        return sorted(matches)
+
+    def findings(self, url, headers, content, timing=None):
+        """
+        :param content: decoded content
+        :return: list of Finding records
+        """
         findings = []
-        findings += self.check_url(url)  # 'url'
+        if content:
+            # meta tags and scripts are found in a single pass over the page, shared by all checks
+            with timed(timing, 'parse'):
+                content = HtmlPage(content)
+        with timed(timing, 'check_url'):
+            findings += self.check_url(url)  # 'url'
         if headers:
-            findings += self.check_headers(headers)  # 'headers'
-            findings += self.check_cookies(headers)  # 'cookies'
+            with timed(timing, 'check_headers'):
+                findings += self.check_headers(headers)  # 'headers'
+            with timed(timing, 'check_cookies'):
+                findings += self.check_cookies(headers)  # 'cookies'
         if content:
-            findings += self.check_meta(content)  # 'meta'
-            findings += self.check_script(content)  # 'script'
-            findings += self.check_html(content)  # 'html'
-
-        self.follow_implies(findings)  # 'implies'
-        self.remove_duplicates(findings)
-        self.remove_exclusions(findings)  # 'excludes'
-        self.add_categories(findings)
+            with timed(timing, 'check_meta'):
+                findings += self.check_meta(content)  # 'meta'
+            with timed(timing, 'check_script'):
+                findings += self.check_script(content)  # 'script'
+            with timed(timing, 'check_html'):
+                findings += self.check_html(content)  # 'html'
+
+        with timed(timing, 'post_processing'):
+            self.follow_implies(findings)  # 'implies'
+            self.remove_duplicates(findings)
+            self.remove_exclusions(findings)  # 'excludes'
 
         return findings
 
-    def detect_multiple(self, urls, limit=None, exclude=None, timeout=TIMEOUT):
+    def detect_multiple(self, urls, limit=None, exclude=None, timeout=TIMEOUT, workers=WORKERS,
+                        processes=PROCESSES, journal=None, host_concurrency=CONCURRENCY_PER_HOST,
+                        host_delay=HOST_DELAY):
+        results = {}
+        for res in self.detect_each(urls, limit, exclude, timeout, workers, processes, journal, host_concurrency,
+                                    host_delay):
+            results.update(res)
+        return results
+
+    def timing_summary(self):
+        """
+        :return: statistics and histograms of time spent in each phase of scanning pages so far (see wad.timing)
+        """
+        return summary(meta['timing'] for meta in self.metadata.values() if 'timing' in meta)
+
+    def detect_each(self, urls, limit=None, exclude=None, timeout=TIMEOUT, workers=WORKERS, processes=PROCESSES,
+                    journal=None, host_concurrency=CONCURRENCY_PER_HOST, host_delay=HOST_DELAY):
+        """
+        Yields results of detect() for each URL as soon as it is available (in completion order);
+        with workers > 1, URLs are scanned concurrently by a pool of threads - interleaving hosts, with at most
+        host_concurrency URLs of a single host scanned at the same time, started at least host_delay seconds apart
+        (see wad.scheduler.HostScheduler);
+        with processes > 0, pages fetched by these threads are analyzed by a pool of processes, using all cores;
+        with a journal (wad.journal.Journal), URLs scanned before are not scanned again (their results from
+        the journal are yielded first), and results of newly scanned URLs are added to it
+        """
         # remove duplicate URLs, remove empty URLs
         urls = list(set(urls) - set([None, ""]))
 
-        results = {}
-        for url in urls:
+        if journal is not None:
+            for url in urls:
+                if url in journal.done:
+                    yield journal.done[url]
+            urls = [url for url in urls if url not in journal.done]
+
+        if self.resolver is not None:
+            urls = self.resolve_hosts(urls, journal)
+
+        if processes > 0 and urls:
+            self.matching_pool = GuardedPool(processes, initializer=init_matching_process,
+                                             initargs=(Clues.filename, Clues.cache_dir, type(self),
+                                                       {'match_bytes': self.match_bytes,
+                                                        'match_timeout': self.match_timeout}))
+
+        scheduler = HostScheduler(urls, host_concurrency, host_delay)
+
+        def scan(_):
+            url = scheduler.acquire()
             try:
-                res = self.detect(url, limit, exclude, timeout)
-                results.update(res)
-            except Exception as e:
-                logging.warn("Error detecting %s: %s", url, e)
+                return self.detect_safe(url, limit, exclude, timeout, journal)
+            finally:
+                scheduler.release(url)
 
+        try:
+            if workers <= 1 or len(urls) <= 1:
+                for i in range(len(urls)):
+                    yield scan(i)
+                return
+
+            pool = ThreadPool(min(workers, len(urls)))
+            try:
+                # each task scans the next URL given by the scheduler
+                for res in pool.imap_unordered(scan, range(len(urls))):
+                    yield res
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+        finally:
+            if self.matching_pool is not None:
+                self.matching_pool.terminate()
+                self.matching_pool.join()
+                self.matching_pool = None
+
+    def resolve_hosts(self, urls, journal=None):
+        """
+        Resolves hosts of all URLs in advance, with the resolver (see wad.resolver.Resolver.resolve_all)
+        :return: URLs of hosts which exist; the others fail immediately, without any HTTP work
+        """
+        not_found = self.resolver.resolve_all(six.moves.urllib.parse.urlparse(url).hostname for url in urls)
+        found = []
+        for url in urls:
+            if six.moves.urllib.parse.urlparse(url).hostname in not_found:
+                logging.warning("Error opening %s, terminating: host doesn't exist", url)
+                if journal is not None:
+                    journal.record(url, {}, error="host doesn't exist")
+            else:
+                found.append(url)
+        return found
+
+    def detect_safe(self, url, limit=None, exclude=None, timeout=TIMEOUT, journal=None):
+        # errors are isolated per URL, so that one broken site doesn't stop the whole scan
+        try:
+            results = self.detect(url, limit, exclude, timeout, raise_errors=True)
+        except FetchError as e:
+            # already logged; recorded as an error, so that the URL is scanned again when the scan is resumed
+            if journal is not None:
+                journal.record(url, {}, error=tools.error_to_str(e))
+            return {}
+        except Exception as e:
+            logging.warning("Error detecting %s: %s", url, e)
+            if journal is not None:
+                journal.record(url, {}, error=tools.error_to_str(e))
+            return {}
+
+        if journal is not None:
+            journal.record(url, results)
         return results
 
     def get_content(self, page, url):
         """
+        Reads the content in chunks, stopping after max_content_size bytes or max_read_time seconds
+        (then only the part read so far is used, and the page is marked as truncated in metadata, and by its
+        truncated attribute, as pages of wad.aio are)
         :return: Content if present, None on handled exception
         """
+        deadline = time.time() + self.max_read_time
+        chunks = []
+        size = 0
+        truncated = False
         try:
-            content = page.read()
+            while True:
+                chunk = page.read(min(CHUNK_SIZE, self.max_content_size - size))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= self.max_content_size:
+                    # the content has been cut, unless it ends exactly here
+                    truncated = bool(page.read(1))
+                    break
+                if time.time() > deadline:
+                    truncated = True
+                    break
         except (socket.timeout, six.moves.http_client.HTTPException, SSLError) as e:
             logging.info("Exception while reading %s, terminating: %s", url, tools.error_to_str(e))
             return None
-        return content
+
+        page.truncated = truncated
+        if truncated:
+            logging.info("Content of %s truncated to %d bytes", url, size)
+            page.close()
+        if self.metadata is not None:
+            self.metadata[url] = {'size': size, 'truncated': truncated}
+        return b''.join(chunks)
 
     def get_page(self, url, timeout=TIMEOUT):
+        entry = self.cache.get(url) if self.cache is not None else None
+        if entry is not None and self.cache.is_fresh(entry):
+            logging.debug("Using cached response for %s", url)
+            return CachedPage(entry)
+
         try:
-            page = tools.urlopen(url, timeout=timeout)
+            page = tools.urlopen(url, timeout=timeout, pool=self.pool,
+                                 headers=self.cache.validators(entry) if entry is not None else None)
         except six.moves.urllib.error.HTTPError as e:
+            if entry is not None and e.code == 304:
+                return self.not_modified(url, e, entry)
             logging.warning("Error opening %s", url)
             page = e
         except six.moves.urllib.error.URLError as e:
             # a network problem? page unavailable? wrong URL?
             logging.warning("Error opening %s, terminating: %s", url, tools.error_to_str(e))
             return None
+        if entry is not None and page.getcode() == 304:
+            return self.not_modified(url, page, entry)
         return page
 
+    def not_modified(self, url, page, entry):
+        logging.debug("Cached response for %s revalidated", url)
+        page.read()
+        page.close()
+        return CachedPage(self.cache.revalidated(entry, page.info().items()), revalidated=True)
+
     def get_new_url(self, page):
         return page.geturl()
 
@@ -121,14 +482,44 @@ class Detector(object):
             return url + '/'
         return url
 
+    def profiled_check_clue(self, re_compiled, re_raw, text, found, det, app, show_match_only=False):
+        start = self.profile.timer()
+        res = Detector.check_clue(self, re_compiled, re_raw, text, found, det, app, show_match_only)
+        self.profile.record(app, det, re_raw, self.profile.timer() - start, bool(res))
+        return res
+
+    def check_clue(self, re_compiled, re_raw, text, found, det, app, show_match_only=False):
+        # check_re with the settings of the detector: bytes regexps, time limit of risky regexps and profiling
+        regexp = re_compiled["re"]
+        raw = self.match_bytes and isinstance(text, bytes)
+        if raw:
+            regexp = self.bytes_regexps[regexp]
+        if regexp in self.risky_regexps:
+            try:
+                match = regex_guard.search(regexp, text, self.match_timeout)
+            except MatchTimeout as e:
+                logging.warning("Clue %s of %s skipped: %s", det, app, e)
+                return []
+        else:
+            match = regexp.search(text)
+        if match and raw:
+            match = DecodedMatch(match)
+            if not show_match_only:
+                text = text.decode('latin-1')
+        return Detector.check_match(match, re_compiled, re_raw, text, found, det, app, show_match_only)
+
     @staticmethod
     def check_re(re_compiled, re_raw, text, found, det, app, show_match_only=False):
         # if re matches text, then add the app(lication) to found
-        res = []
         match = re_compiled["re"].search(text)
+        return Detector.check_match(match, re_compiled, re_raw, text, found, det, app, show_match_only)
+
+    @staticmethod
+    def check_match(match, re_compiled, re_raw, text, found, det, app, show_match_only=False):
+        # if re matched text, then add the app(lication) to found
+        res = []
         if match:
             ver = None
-
             if show_match_only:
                 show_text = match.group(0)
             else:
@@ -165,49 +556,82 @@ class Detector(object):
 
             logging.info("  + %-7s -> %s (%s): %s =~ %s", det, app, ver, show_text, re_raw)
 
-            res = [{'app': str(app), 'ver': ver or None}]
+            res = [Finding(str(app), ver or None, det)]
             found += res
 
         return res
 
     def check_tag(self, data, key, key_re, show_match_only=False):
         found = []
-        for app in self.apps:
-            if key in self.apps[app]:
-                for i in range(len(self.apps[app][key_re])):
-                    self.check_re(self.apps[app][key_re][i], self.apps[app][key][i], data, found, key, app,
-                                  show_match_only)
+        decoded = None
+        # only clues whose trigger literal is present in data are run
+        for app, i in self.tables[key].candidates(data):
+            re_compiled = self.apps[app][key_re][i]
+            text = data
+            if self.match_bytes and isinstance(data, bytes) and re_compiled["re"] not in self.bytes_regexps:
+                # the clue can't be matched on raw content, which is then decoded (once)
+                if decoded is None:
+                    decoded = data.decode('latin-1')
+                text = decoded
+            self.check_clue(re_compiled, self.apps[app][key][i], text, found, key, app, show_match_only)
         return found
 
     def check_url(self, url):
         return self.check_tag(data=url, key='url', key_re='url_re', show_match_only=False)
 
+    @staticmethod
+    def html_page(content):
+        """
+        :param content: decoded content, or its wad.page.HtmlPage
+        """
+        return content if isinstance(content, HtmlPage) else HtmlPage(content)
+
     def check_html(self, content):
-        return self.check_tag(data=content, key='html', key_re='html_re', show_match_only=True)
+        text = content.text if isinstance(content, HtmlPage) else content
+        return self.check_tag(data=text, key='html', key_re='html_re', show_match_only=True)
 
     def check_script(self, content):
-        found = []
-        for tag in re_script.finditer(content):
-            found.extend(self.check_tag(data=tag.group(1), key='script', key_re='script_re', show_match_only=False))
-        return found
+        srcs = self.html_page(content).script_srcs
+        if len(srcs) < 2 or any('\n' in src for src in srcs):
+            found = []
+            for src in srcs:
+                found.extend(self.check_tag(data=src, key='script', key_re='script_re', show_match_only=False))
+            return found
+
+        # sources are matched in one pass, as lines of a single text: each clue is searched for in the text, and
+        # checked on the sources in which its matches start (only these can match it, see Clues.joinable); other
+        # clues are checked on each source
+        text = '\n'.join(srcs)
+        starts = [0]
+        for src in srcs[:-1]:
+            starts.append(starts[-1] + len(src) + 1)
+        found_in = [[] for _ in srcs]
+        for app, i in self.tables['script'].candidates(text):
+            re_compiled, re_raw = self.apps[app]['script_re'][i], self.apps[app]['script'][i]
+            joined = self.joined_regexps.get(re_compiled['re'])
+            if joined is None:
+                for src, found in zip(srcs, found_in):
+                    if self.tables['script'].is_candidate(app, i, src):
+                        self.check_clue(re_compiled, re_raw, src, found, 'script', app)
+                continue
+            pos = 0
+            while True:
+                match = joined.search(text, pos)
+                if match is None:
+                    break
+                n = bisect.bisect_right(starts, match.start()) - 1
+                self.check_clue(re_compiled, re_raw, srcs[n], found_in[n], 'script', app)
+                if n + 1 == len(srcs):
+                    break
+                pos = starts[n + 1]
+        return [finding for found in found_in for finding in found]
 
     def check_meta(self, content):
         found = []
-        for tag in re_meta.finditer(content):
-            meta_tag = tag.group(0)
-            name_matches = re_name.findall(meta_tag)
-            content_matches = re_content.findall(meta_tag)
-            if not name_matches or not content_matches:
-                continue
-
-            name = name_matches[0]
-            content = content_matches[0]
-            for app in self.apps:
-                if 'meta' in self.apps[app]:
-                    for meta in self.apps[app]['meta']:
-                        if name.lower() == meta.lower():
-                            self.check_re(self.apps[app]["meta_re"][meta], self.apps[app]['meta'][meta],
-                                          content, found, 'meta(%s)' % meta, app)
+        for name, content in self.html_page(content).meta:
+            for app, meta in self.keyed_tables['meta'].get(name.lower(), []):
+                self.check_clue(self.apps[app]["meta_re"][meta], self.apps[app]['meta'][meta],
+                                content, found, 'meta(%s)' % meta, app)
 
         return found
 
@@ -215,15 +639,14 @@ class Detector(object):
         headers = dict((k.lower(), v) for k, v in headers.items())
 
         found = []
-        for app in self.apps:
-            if 'headers' in self.apps[app]:
-                for entry in self.apps[app]['headers']:
-                    if entry.lower() in headers:
-                        self.check_re(self.apps[app]['headers_re'][entry], self.apps[app]['headers'][entry],
-                                      headers[entry.lower()], found, 'headers(%s)' % entry, app)
+        for name in headers:
+            for app, entry in self.keyed_tables['headers'].get(name, []):
+                self.check_clue(self.apps[app]['headers_re'][entry], self.apps[app]['headers'][entry],
+                                headers[name], found, 'headers(%s)' % entry, app)
         return found
 
-    def check_cookies(self, headers):
+    @staticmethod
+    def parse_cookies(headers):
         cookies = dict()
         for cookie in headers.get('Set-Cookie', '').split(';'):
             if '=' in cookie:
@@ -231,83 +654,98 @@ class Detector(object):
                 cookie_name = cookie[:sep].strip()
                 cookie_val = cookie[sep+1:].strip()
                 cookies[cookie_name] = cookie_val
+        return cookies
 
-        if not cookies:
-            return []
+    def check_cookies(self, headers):
+        cookies = self.parse_cookies(headers)
 
         found = []
-        for app in self.apps:
-            if 'cookies' in self.apps[app]:
-                for entry in self.apps[app]['cookies']:
-                    if entry in cookies:
-                        self.check_re(self.apps[app]['cookies_re'][entry], self.apps[app]['cookies'][entry],
-                                      cookies[entry], found, 'cookies(%s)' % entry, app)
+        for name in cookies:
+            for app, entry in self.keyed_tables['cookies'].get(name, []):
+                self.check_clue(self.apps[app]['cookies_re'][entry], self.apps[app]['cookies'][entry],
+                                cookies[name], found, 'cookies(%s)' % entry, app)
         return found
 
     def implied_by(self, app_list):
-        all_implied = [implied for app in app_list
-                       if 'implies' in self.apps.get(app, {})
-                       for implied in self.apps[app]['implies']]
-        implied_new = set(all_implied) - set(app_list)
+        # apps implied by those of app_list, directly or not (see wad.clues.AppRelations), which aren't in it
+        index, implies = self.relations.index, self.relations.implies
+        implied = set()
+        for app in app_list:
+            if app in index:
+                implied.update(implies[index[app]])
+        implied_new = set(self.relations.names[i] for i in implied) - set(app_list)
         return implied_new
 
     def follow_implies(self, findings):
-        new = self.implied_by([f['app'] for f in findings])
-        while new:
-            for app in new:
-                findings += [{'app': app, 'ver': None}]
-                logging.info("  + %-7s -> %s", "implies", app)
-
-            new = self.implied_by([f['app'] for f in findings])
+        # implies of implied apps are already included in the closure of each app (see wad.clues.AppRelations)
+        names, index, implies = self.relations.names, self.relations.index, self.relations.implies
+        present = set(f.app for f in findings)
+        for f in findings[:]:
+            for i in implies[index[f.app]] if f.app in index else ():
+                if names[i] not in present:
+                    present.add(names[i])
+                    findings += [Finding(names[i], None, 'implies')]
+                    logging.info("  + %-7s -> %s", "implies", names[i])
 
     @staticmethod
     def remove_duplicates(findings):
-        temp = copy.deepcopy(findings)
-
-        # empty list findings
-        # (keeping the existing list reference, rather than creating new list with 'findings = []' )
-        findings[:] = []
-
-        # loop over temp and insert back info findings unless it already exists
-        for t in temp:
-            already = False
-            for f in findings:
-                if t == f:
-                    already = True
-                elif t['app'] == f['app']:
-                    # same app but different versions - now decide which one to take
-
-                    # if f is empty or prefix of t then overwrite f with t
-                    if f['ver'] is None or (t['ver'] is not None and t['ver'].find(f['ver']) == 0):
-                        f['ver'] = t['ver']
-                        already = True
-                    # if t is empty or prefix of f, then ignore t
-                    elif t['ver'] is None or f['ver'].find(t['ver']) == 0:
-                        already = True
-
-            # if t is new, then add it to final findings
-            if not already:
-                findings += [t]
+        # in one pass, findings of an app already found are merged with the earlier ones: if an earlier version is
+        # unknown or a prefix of the new one, it's replaced by the new one; if the new version is unknown or
+        # a prefix of an earlier one, the new finding is dropped; otherwise (e.g. "7.0" and "222") both are kept
+        kept = []
+        versions = {}  # app -> {version: finding kept with it}, None being the version of a finding without one
+        prefixes = {}  # app -> all prefixes of versions kept (which are never prefixes of each other)
+        for t in findings:
+            app_versions = versions.get(t.app)
+            if app_versions is None:
+                app_versions = versions[t.app] = {}
+                prefixes[t.app] = set()
+                f = t
+                kept.append(t)
+            elif None in app_versions:
+                # the only finding of the app so far, without a version
+                f = app_versions.pop(None)
+            elif t.ver is None or t.ver in prefixes[t.app]:
+                continue
+            else:
+                # at most one of earlier versions can be a prefix of the new one
+                f = next((app_versions.pop(t.ver[:i]) for i in range(len(t.ver)) if t.ver[:i] in app_versions),
+                         None)
+                if f is None:
+                    f = t
+                    kept.append(t)
+
+            f.ver = t.ver
+            app_versions[t.ver] = f
+            if t.ver is not None:
+                prefixes[t.app].update(t.ver[:i] for i in range(len(t.ver) + 1))
+
+        # keeping the existing list reference, rather than creating new list with 'findings = []'
+        findings[:] = kept
 
     def excluded_by(self, app_list):
-        to_exclude = list(
-            set(six.moves.reduce(list.__add__,
-                                 [self.apps[app]['excludes'] for app in app_list if 'excludes' in self.apps[app]], [])))
+        index, excludes = self.relations.index, self.relations.excludes
+        excluded = set()
+        for app in app_list:
+            if app in index:
+                excluded.update(excludes[index[app]])
+        to_exclude = [self.relations.names[i] for i in sorted(excluded)]
         if len(to_exclude) > 0:
             logging.info("  - excluding apps: %s", ','.join(to_exclude))
         return to_exclude
 
     def remove_exclusions(self, findings):
-        excluded = self.excluded_by([f['app'] for f in findings])
-        for app in excluded:
-            for f in findings:
-                if f['app'] == app:
-                    findings.remove(f)
+        excluded = set(self.excluded_by([f.app for f in findings]))
+        if excluded:
+            findings[:] = [f for f in findings if f.app not in excluded]
 
-    def add_categories(self, findings):
+    def materialize(self, findings):
+        """
+        :param findings: list of Finding records
+        :return: findings as dicts of the output, e.g. [{'app': 'Drupal', 'ver': '7', 'type': 'CMS'}, ...]
+        """
         # some apps are in several categories => merged to a comma-separated string
-        for f in findings:
-            f['type'] = self.apps[f['app']]['catsStr']
+        return [{'app': f.app, 'ver': f.ver, 'type': self.apps[f.app]['catsStr']} for f in findings]
 
     @staticmethod
     def url_match(url, regexp, default):
@@ -330,6 +768,6 @@ class Detector(object):
         :param page: page retrieved with urllib2
         :param url: page url
         :param content: decoded content
-        :return: list of findings
+        :return: list of findings, as dicts of the output (see materialize)
         """
         return []
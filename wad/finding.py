@@ -0,0 +1,35 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+
+class Finding(object):
+    """
+    App detected on a page: its name, version (None if unknown) and the type of evidence it was detected by
+    (e.g. 'html', 'headers(Server)' or 'implies'), in a compact record used while analyzing the page; results
+    are materialized as dicts of the output, {'app': ..., 'ver': ..., 'type': ...}, only after that
+    (see Detector.materialize). Findings are equal if they have the same app and version, whatever the evidence.
+    """
+    __slots__ = ('app', 'ver', 'det')
+
+    def __init__(self, app, ver=None, det=None):
+        self.app = app
+        self.ver = ver
+        self.det = det
+
+    def __eq__(self, other):
+        return isinstance(other, Finding) and self.app == other.app and self.ver == other.ver
+
+    def __ne__(self, other):
+        return not self == other
+
+    # mutable (versions are merged), so not hashable
+    __hash__ = None
+
+    def __repr__(self):
+        return "Finding(%r, %r, %r)" % (self.app, self.ver, self.det)
+
+    # records are pickled when sent from processes of the matching pool, and copied by the findings memo
+    def __getstate__(self):
+        return self.app, self.ver, self.det
+
+    def __setstate__(self, state):
+        self.app, self.ver, self.det = state
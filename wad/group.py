@@ -24,9 +24,10 @@ def get_dir(url_path):
 
 
 def subpath_starts_with(s, subs, subpath_had_extension=False):
-    if subpath_had_extension:
-        return s.find(subs) == 0
-    return s.find(subs) == 0 and s != subs
+    # whole path segments are compared, so that /foo/bar is under /foo, but /foobar isn't
+    if s == subs:
+        return subpath_had_extension
+    return s.startswith(subs + "/")
 
 
 def is_sub_url(url, suburl):
@@ -45,21 +46,69 @@ def is_sub_url(url, suburl):
     return subpath_starts_with(subpath, path, subpath_had_extension)
 
 
+class UrlTreeNode(object):
+    """
+    Directory in the URL tree, with URLs pointing to the directory itself, and to files in it
+    """
+    __slots__ = ('children', 'dirs', 'files')
+
+    def __init__(self):
+        self.children = {}
+        self.dirs = []
+        self.files = []
+
+
+def url_tree(urls):
+    """
+    :return: dict of (scheme, netloc) -> root UrlTreeNode, with URLs placed in nodes by their path segments
+    """
+    roots = {}
+    for url in urls:
+        parsed = six.moves.urllib.parse.urlparse(url)
+        path, had_extension = get_dir(parsed[2])
+        node = roots.setdefault(parsed[:2], UrlTreeNode())
+        for segment in path.split("/"):
+            if segment:
+                node = node.children.setdefault(segment, UrlTreeNode())
+        (node.files if had_extension else node.dirs).append(url)
+    return roots
+
+
+def finding_key(finding):
+    return tuple(sorted(finding.items()))
+
+
 def group(results):
     logging.info("Grouping results")
-    # for each pair of URLs, if one is a suburl of the other, then remove from
-    # the latter url any technologies detected also for the former
-    for url in results:
-        for url2 in results:
-            if is_sub_url(url, url2):
-                logging.debug("--> %s\n`-> %s\n", url, url2)
-                for finding in results[url]:
-                    if finding in results[url2]:
-                        results[url2].remove(finding)
-                        logging.debug("Removing %s from %s, as %s also has it", finding, url2, url)
+    # remove from each URL any technologies detected also for URLs above it (i.e. for its directory or parent
+    # directories) - or, for files, also for the directory of the file and for files in it listed earlier
+    keys = dict((url, [finding_key(finding) for finding in findings]) for url, findings in six.iteritems(results))
+    originals = dict((url, set(url_keys)) for url, url_keys in six.iteritems(keys))
+
+    def remove(url, found_above):
+        findings = [finding for finding, key in zip(results[url], keys[url]) if key not in found_above]
+        if len(findings) != len(results[url]):
+            logging.debug("Removing %d technologies from %s, found also above it",
+                          len(results[url]) - len(findings), url)
+            results[url][:] = findings
+
+    # depth-first walk of the tree, with technologies found above each node (stack instead of recursion,
+    # as the tree can be deep)
+    stack = [(root, frozenset()) for root in url_tree(results).values()]
+    while stack:
+        node, found_above = stack.pop()
+        found_here = set(found_above)
+        for url in node.dirs:
+            remove(url, found_above)
+            found_here.update(originals[url])
+        for url in node.files:
+            remove(url, found_here)
+            found_here.update(originals[url])
+        found_here = frozenset(found_here)
+        stack.extend((child, found_here) for child in node.children.values())
 
     # ... and then remove any urls without any findings
-    for url in results.keys():
+    for url in list(results):
         if not results[url]:
             results.pop(url)
 
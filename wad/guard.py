@@ -0,0 +1,93 @@
+# Time limit for matching clue patterns prone to catastrophic backtracking
+#
+# Python's re can't be interrupted, so such patterns are searched in a separate process, which is killed (and
+# started again) when a search takes too long. All searches of these patterns are done there, whatever the length
+# of the text: the slowest ones are on short texts, e.g. a meta tag of a few dozen characters. Processes of the
+# matching pool (see wad.detection) have guard processes of their own, so they're not daemons (see GuardedPool).
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+import multiprocessing
+import multiprocessing.pool
+import threading
+
+MATCH_TIMEOUT = 2  # seconds for searching a single risky pattern in a single text
+
+
+class MatchTimeout(Exception):
+    pass
+
+
+def search_start(regexp, text):
+    # runs in the guard process; compiled regexps are pickled as (pattern, flags)
+    match = regexp.search(text)
+    return match.start() if match else None
+
+
+class RegexGuard(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def search(self, regexp, text, timeout=MATCH_TIMEOUT):
+        """
+        The same as regexp.search(text), but limited by timeout
+        :raises MatchTimeout: if the search took too long, and was killed
+        """
+        if not timeout:
+            return regexp.search(text)
+
+        # searches are done one by one, by a single process
+        with self.lock:
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(1)
+            result = self.pool.apply_async(search_start, (regexp, text))
+            try:
+                start = result.get(timeout)
+            except multiprocessing.TimeoutError:
+                self.close()
+                raise MatchTimeout("searching %r took longer than %s s" % (regexp.pattern, timeout))
+
+        # the match is recreated at its start, without the (possibly long) failed attempts at earlier positions
+        return None if start is None else regexp.match(text, start)
+
+    def reset(self):
+        # in a forked process, the guard process (and the lock) of the parent process can't be used
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def close(self):
+        if self.pool is not None:
+            logging.debug("Stopping regexp guard process")
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+
+regex_guard = RegexGuard()  # shared by all detectors
+
+
+class GuardedProcess(multiprocessing.Process):
+    # a process of a pool, which isn't a daemon (whatever the pool sets), so that it can start its guard process;
+    # daemonic processes can't have children
+    @property
+    def daemon(self):
+        return False
+
+    @daemon.setter
+    def daemon(self, value):
+        pass
+
+    def run(self):
+        regex_guard.reset()
+        super(GuardedProcess, self).run()
+
+
+class GuardedPool(multiprocessing.pool.Pool):
+    """
+    multiprocessing.Pool, whose processes search risky patterns with a time limit too
+    """
+    @staticmethod
+    def Process(*args, **kwargs):
+        # on Python 3.8+, the context of the pool is passed first
+        return GuardedProcess(**kwargs)
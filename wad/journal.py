@@ -0,0 +1,65 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import six
+
+import io
+import json
+import logging
+import os
+import threading
+
+
+class Journal(object):
+    """
+    Append-only file (JSON Lines) with results of each scanned URL, written as soon as the URL is scanned,
+    so that an interrupted scan can be resumed - URLs already in the journal are not scanned again, unless
+    they failed (e.g. the network was down)
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.done = {}  # successfully scanned URL -> its results, i.e. {final URL: findings}
+        self.errors = {}  # failed URL -> error message (of the last attempt, if it didn't succeed later)
+        self.load()
+        self.f = io.open(filename, 'a', encoding='utf-8')
+        if self.truncated:
+            # the last line was partially written when the previous scan was interrupted
+            self.f.write('\n')
+
+    def load(self):
+        self.truncated = False
+        if not os.path.exists(self.filename):
+            return
+        with io.open(self.filename, 'r', encoding='utf-8') as f:
+            for line in f:
+                self.truncated = not line.endswith('\n')
+                try:
+                    entry = json.loads(line)
+                    url, results = entry['url'], entry['results']
+                except (ValueError, KeyError, TypeError):
+                    logging.warning("Ignoring invalid line in journal %s: %r", self.filename, line[:100])
+                    continue
+                self.add(url, results, entry.get('error'))
+        logging.info("Journal %s: %d URLs already scanned, %d failed (to be scanned again)", self.filename,
+                     len(self.done), len(self.errors))
+
+    def add(self, url, results, error):
+        if error:
+            self.errors[url] = error
+        else:
+            self.done[url] = results
+            self.errors.pop(url, None)
+
+    def record(self, url, results, error=None):
+        entry = {'url': url, 'results': results}
+        if error:
+            entry['error'] = error
+        line = json.dumps(entry, separators=(',', ':'))
+        with self.lock:
+            self.add(url, results, error)
+            # flushed, so that the entry survives the scanning process being killed
+            self.f.write(six.text_type(line) + '\n')
+            self.f.flush()
+
+    def close(self):
+        with self.lock:
+            self.f.close()
@@ -12,6 +12,34 @@ class OutputFormat(object):
     def retrieve(self, results):
         raise NotImplementedError
 
+    def header(self):
+        return ''
+
+    def entry(self, url, findings, index):
+        """
+        :param index: number of entries written before this one
+        :return: results for a single URL, formatted for streaming
+        """
+        raise NotImplementedError
+
+    def footer(self):
+        return ''
+
+    def stream(self, results, f):
+        """
+        Writes results of each URL to f as soon as they are available, flushing after each write
+        :param results: iterable of {url: findings} dicts, e.g. Detector.detect_each()
+        """
+        f.write(self.header())
+        index = 0
+        for res in results:
+            for url, findings in six.iteritems(res):
+                f.write(self.entry(url, findings, index))
+                f.flush()
+                index += 1
+        f.write(self.footer())
+        f.flush()
+
 
 class JSONOutput(OutputFormat):
     """
@@ -23,6 +51,28 @@ class JSONOutput(OutputFormat):
             return json.dumps(results, indent=indent)
         return json.dumps(results)
 
+    # streamed JSON is a single object too, with one line per URL
+    def header(self):
+        return '{\n'
+
+    def entry(self, url, findings, index):
+        return '%s%s: %s' % (',\n' if index else '', json.dumps(url), json.dumps(findings))
+
+    def footer(self):
+        return '\n}\n'
+
+
+class JSONLinesOutput(OutputFormat):
+    """
+    :return: JSON object {url: findings} for each URL, one per line
+    """
+    def retrieve(self, results):
+        return ''.join(self.entry(url, findings, index)
+                       for index, (url, findings) in enumerate(six.iteritems(results)))
+
+    def entry(self, url, findings, index):
+        return json.dumps({url: findings}) + '\n'
+
 
 class ConsolePrettyOutput(OutputFormat):
     """
@@ -41,12 +91,16 @@ class HumanReadableOutput(OutputFormat):
             return ''
         output = ''
         for url, data_dicts in six.iteritems(results):
-            output += 'Web application detection results for website {url}, found applications:\n'.format(url=url)
-            for data in data_dicts:
-                output += '\t{app} ({type})'.format(app=data['app'], type=data['type'])
-                if data['ver']:
-                    output += ', version: {version}'.format(version=data['ver'])
-                output += '\n'
+            output += self.entry(url, data_dicts, None)
+        return output
+
+    def entry(self, url, findings, index):
+        output = 'Web application detection results for website {url}, found applications:\n'.format(url=url)
+        for data in findings:
+            output += '\t{app} ({type})'.format(app=data['app'], type=data['type'])
+            if data['ver']:
+                output += ', version: {version}'.format(version=data['ver'])
+            output += '\n'
         return output
 
 
@@ -55,6 +109,8 @@ class CSVOutput(OutputFormat):
     :param
     :return: string formatted as CSV
     """
+    fieldnames = ['URL', 'Finding', 'Version', 'Type']
+
     def __init__(self, filename=None):
         super(CSVOutput, self).__init__()
 
@@ -73,17 +129,29 @@ class CSVOutput(OutputFormat):
         :return:
         """
         buf = self.get_buffer()
-        fieldnames = ['URL', 'Finding', 'Version', 'Type']
-        writer = csv.DictWriter(buf, fieldnames)
+        writer = csv.DictWriter(buf, self.fieldnames)
 
         # Can't use writeheader method, because it was introduced in python 2.7
-        writer.writerow(dict([(field, field) for field in fieldnames]))
+        writer.writerow(dict([(field, field) for field in self.fieldnames]))
         for url, data_dicts in six.iteritems(results):
             for data in data_dicts:
                 writer.writerow({'URL': url, 'Finding': data['app'], 'Version': data['ver'], 'Type': data['type']})
 
         return self.return_handler(buf)
 
+    def format_rows(self, rows):
+        buf = six.StringIO()
+        writer = csv.DictWriter(buf, self.fieldnames)
+        writer.writerows(rows)
+        return buf.getvalue()
+
+    def header(self):
+        return self.format_rows([dict([(field, field) for field in self.fieldnames])])
+
+    def entry(self, url, findings, index):
+        return self.format_rows([{'URL': url, 'Finding': data['app'], 'Version': data['ver'], 'Type': data['type']}
+                                 for data in findings])
+
     def get_stringio(self):
         return six.StringIO()
 
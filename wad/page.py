@@ -0,0 +1,85 @@
+# Model of an HTML page, for clues matched against parts of it (meta tags, script sources)
+#
+# The page is tokenized in a single pass, in the way browsers do it as far as clues are concerned: attributes
+# in any order, quoted with either quote or unquoted, and not confused with other attributes ending the same
+# (e.g. 'data-src'). Tags in comments and in inline scripts are found too, as they're often scripts loaded by
+# some browsers, or by the inline script, e.g. <!--[if lt IE 9]><script src="..."><![endif]--> or
+# document.write('<script src="...">').
+#
+# Raw content can be tokenized as well, without decoding it as a whole: only values of attributes are decoded
+# (as latin-1), and the model is the same as of the decoded content.
+from __future__ import absolute_import, division, print_function, unicode_literals
+import six
+
+import re
+
+# whitespace is ASCII only (as in HTML), so that text and bytes are tokenized in the same way
+FLAGS = getattr(re, 'ASCII', 0)
+# start of a tag which is modelled
+TAG_START = r'<(meta|script)(?=[\s/>])'
+# as by browsers, names of attributes may contain quotes and start with '=' (e.g. a bare "junk" is an attribute), so
+# that a malformed attribute doesn't stop the tag from being tokenized
+ATTRIBUTE = r'''[\s/]*([^\s>/][^\s>/=]*)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?'''
+TAG_END = r'[\s/]*>'
+
+re_tag_start = re.compile(TAG_START, FLAGS | re.IGNORECASE)
+re_attribute = re.compile(ATTRIBUTE, FLAGS)
+re_tag_end = re.compile(TAG_END, FLAGS)
+re_bytes_tag_start = re.compile(TAG_START.encode('ascii'), FLAGS | re.IGNORECASE)
+re_bytes_attribute = re.compile(ATTRIBUTE.encode('ascii'), FLAGS)
+re_bytes_tag_end = re.compile(TAG_END.encode('ascii'), FLAGS)
+
+
+class HtmlPage(object):
+    def __init__(self, text):
+        """
+        :param text: decoded content, or raw content (bytes)
+        """
+        self.text = text
+        self.tags = []  # (tag name, {attribute name: value}) of meta and script tags, in order of the page
+        self.meta = []  # (name, content) of meta tags having both, not empty
+        self.script_srcs = []  # sources of scripts, in order of the page
+        self.tokenize()
+
+    def tokenize(self):
+        text = self.text
+        raw = six.PY3 and isinstance(text, bytes)
+        if raw:
+            tag_start, attribute_re, tag_end = re_bytes_tag_start, re_bytes_attribute, re_bytes_tag_end
+        else:
+            tag_start, attribute_re, tag_end = re_tag_start, re_attribute, re_tag_end
+        pos = 0
+        while True:
+            start = tag_start.search(text, pos)
+            if start is None:
+                break
+
+            tag = start.group(1).decode('latin-1') if raw else start.group(1)
+            tag = tag.lower()
+            attributes = {}
+            pos = start.end()
+            while True:
+                attribute = attribute_re.match(text, pos)
+                if attribute is None:
+                    break
+                pos = attribute.end()
+                name = attribute.group(1).decode('latin-1') if raw else attribute.group(1)
+                name = name.lower()
+                if name not in attributes:
+                    # the first one of repeated attributes is used, as by browsers
+                    value = next((v for v in attribute.group(2, 3, 4) if v is not None), None)
+                    if value is None:
+                        value = ''
+                    elif raw:
+                        value = value.decode('latin-1')
+                    attributes[name] = value
+            end = tag_end.match(text, pos)
+            if end is not None:
+                pos = end.end()
+            self.tags.append((tag, attributes))
+
+            if tag == 'script':
+                if 'src' in attributes:
+                    self.script_srcs.append(attributes['src'])
+            elif attributes.get('name') and attributes.get('content'):
+                self.meta.append((attributes['name'], attributes['content']))
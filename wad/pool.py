@@ -0,0 +1,248 @@
+# HTTP client with per-host pools of keep-alive connections
+#
+# Responses mimic those of urllib (geturl, info, read, HTTPError for error statuses, redirections followed),
+# so that they can be used in place of tools.urlopen() results. Proxies are used as by urllib: the ones given in
+# http_proxy and https_proxy environment variables, except for hosts in no_proxy.
+from __future__ import absolute_import, division, print_function, unicode_literals
+import six
+
+import base64
+import logging
+import socket
+import ssl
+import threading
+
+from wad import tools
+from wad.resolver import connect_to
+from wad.timing import add_time, timer
+
+MAX_CONNECTIONS = 4  # idle connections kept per host
+MAX_REDIRECTIONS = 10  # same as in urllib
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+DRAIN_SIZE = 64 * 1024  # bodies of redirections up to this size are read, so that the connection can be reused
+
+
+class HTTPConnection(six.moves.http_client.HTTPConnection):
+    """
+    HTTP connection using addresses from a given wad.resolver.Resolver, if any
+    """
+    def __init__(self, host, port=None, timeout=None, resolver=None):
+        six.moves.http_client.HTTPConnection.__init__(self, host, port, timeout=timeout)
+        self.resolver = resolver
+        self.timing = {}  # phases of connecting, see wad.timing
+
+    def connect(self):
+        start = timer()
+        if self.resolver is None:
+            addresses = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)
+        else:
+            addresses = self.resolver.resolve(self.host, self.port)
+        resolved = timer()
+        self.sock = connect_to(addresses, self.timeout, self.host)
+        self.timing = {'dns': resolved - start, 'connect': timer() - resolved}
+
+
+class HTTPSConnection(six.moves.http_client.HTTPSConnection):
+    """
+    HTTPS connection resuming a given TLS session, if any, and using addresses from a given resolver, if any
+    """
+    def __init__(self, host, port=None, timeout=None, context=None, session=None, resolver=None):
+        six.moves.http_client.HTTPSConnection.__init__(self, host, port, timeout=timeout, context=context)
+        self.session = session
+        self.resolver = resolver
+        self.timing = {}
+
+    def connect(self):
+        HTTPConnection.connect(self)
+        start = timer()
+        if self._tunnel_host:
+            # connected to a proxy, through which the connection to the host is tunnelled
+            self._tunnel()
+        kwargs = {'server_hostname': self._tunnel_host or self.host}
+        if self.session is not None:
+            kwargs['session'] = self.session
+        self.sock = self._context.wrap_socket(self.sock, **kwargs)
+        self.timing['tls'] = timer() - start
+
+
+class PooledResponse(object):
+    """
+    Response which gives its connection back to the pool once the body has been read
+    """
+    def __init__(self, pool, key, conn, response, url, timing):
+        self.pool = pool
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.url = url
+        self.code = self.status = response.status
+        self.msg = self.reason = response.reason
+        self.headers = response.msg
+        # phases of getting the response (see wad.timing), e.g. {'dns': 0.002, 'connect': 0.011, 'ttfb': 0.2}
+        self.timing = timing
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.code
+
+    def read(self, amt=None):
+        if self.conn is None:
+            return b''
+        data = self.response.read() if amt is None else self.response.read(amt)
+        if amt is None or (amt and not data):
+            # whole body read
+            self.release()
+        return data
+
+    def release(self):
+        if self.conn is not None:
+            self.pool.release(self.key, self.conn, reusable=not self.response.will_close)
+            self.conn = None
+
+    def close(self):
+        # connection with a partially read body can't be reused
+        if self.conn is not None:
+            self.response.close()
+            self.pool.release(self.key, self.conn, reusable=False)
+            self.conn = None
+
+
+class ConnectionPool(object):
+    def __init__(self, max_connections=MAX_CONNECTIONS, resolver=None):
+        """
+        :param max_connections: idle connections kept per host; with 0, connections aren't reused at all
+        :param resolver: optional wad.resolver.Resolver, for connecting to cached addresses
+        """
+        self.max_connections = max_connections
+        self.resolver = resolver
+        self.context = ssl._create_unverified_context()
+        self.lock = threading.Lock()
+        self.idle = {}  # (scheme, host, port, proxy) -> [connection, ...]
+        self.sessions = {}  # (scheme, host, port, proxy) -> last TLS session, for resumption
+        self.proxies = six.moves.urllib.request.getproxies()  # scheme -> proxy URL
+
+    def proxy(self, scheme, host):
+        """
+        :return: (proxy host, proxy port, Proxy-Authorization header or None) for requests to the host,
+                 None if it's connected to directly
+        """
+        proxy_url = self.proxies.get(scheme)
+        if not proxy_url or six.moves.urllib.request.proxy_bypass(host):
+            return None
+        if '://' not in proxy_url:
+            proxy_url = 'http://' + proxy_url
+        parsed = six.moves.urllib.parse.urlsplit(proxy_url)
+        authorization = None
+        if parsed.username is not None:
+            credentials = "%s:%s" % (six.moves.urllib.parse.unquote(parsed.username),
+                                     six.moves.urllib.parse.unquote(parsed.password or ''))
+            authorization = "Basic " + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        return parsed.hostname, parsed.port or 80, authorization
+
+    def acquire(self, key, timeout):
+        """
+        :return: (connection, True if it's a reused one)
+        """
+        with self.lock:
+            if self.idle.get(key):
+                conn = self.idle[key].pop()
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+            session = self.sessions.get(key)
+
+        scheme, host, port, proxy = key
+        if scheme == 'https':
+            if proxy is not None:
+                conn = HTTPSConnection(proxy[0], proxy[1], timeout=timeout, context=self.context, session=session,
+                                       resolver=self.resolver)
+                conn.set_tunnel(host, port, headers={'Proxy-Authorization': proxy[2]} if proxy[2] else None)
+                return conn, False
+            return HTTPSConnection(host, port, timeout=timeout, context=self.context, session=session,
+                                   resolver=self.resolver), False
+        if proxy is not None:
+            return HTTPConnection(proxy[0], proxy[1], timeout=timeout, resolver=self.resolver), False
+        return HTTPConnection(host, port, timeout=timeout, resolver=self.resolver), False
+
+    def release(self, key, conn, reusable=True):
+        session = getattr(conn.sock, 'session', None)
+        with self.lock:
+            if session is not None:
+                self.sessions[key] = session
+            idle = self.idle.setdefault(key, [])
+            if reusable and conn.sock is not None and len(idle) < self.max_connections:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            connections = [conn for idle in self.idle.values() for conn in idle]
+            self.idle = {}
+        for conn in connections:
+            conn.close()
+
+    def request(self, url, timeout, headers):
+        parsed = six.moves.urllib.parse.urlsplit(url)
+        if parsed.scheme not in ('http', 'https'):
+            raise six.moves.urllib.error.URLError("unknown url type: %s" % parsed.scheme)
+        try:
+            port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        except ValueError as e:
+            raise six.moves.urllib.error.URLError(e)
+        proxy = self.proxy(parsed.scheme, parsed.hostname)
+        key = (parsed.scheme, parsed.hostname, port, proxy)
+        path = six.moves.urllib.parse.urlunsplit(('', '', parsed.path or '/', parsed.query, ''))
+        if proxy is not None and parsed.scheme == 'http':
+            # a plain HTTP proxy gets the whole URL
+            path = six.moves.urllib.parse.urlunsplit((parsed.scheme, parsed.netloc, parsed.path or '/',
+                                                      parsed.query, ''))
+            if proxy[2]:
+                headers = dict(headers)
+                headers['Proxy-Authorization'] = proxy[2]
+
+        while True:
+            conn, reused = self.acquire(key, timeout)
+            # a reused connection is already connected, so these phases are only timed for a new one
+            conn.timing = {}
+            try:
+                conn.request('GET', path, headers=headers)
+                sent = timer()
+                response = conn.getresponse()
+                first_byte = timer()
+            except (socket.error, six.moves.http_client.HTTPException) as e:
+                conn.close()
+                if reused:
+                    # keep-alive connection closed by the server in the meantime - retry with another one
+                    logging.debug("Reused connection to %s failed, retrying: %s", key, tools.error_to_str(e))
+                    continue
+                raise six.moves.urllib.error.URLError(e)
+            return PooledResponse(self, key, conn, response, url, dict(conn.timing, ttfb=first_byte - sent))
+
+    def urlopen(self, url, timeout, headers=None):
+        headers = headers or {}
+        timing = {}
+        for _ in range(MAX_REDIRECTIONS + 1):
+            page = self.request(url, timeout, headers)
+            for phase, seconds in six.iteritems(page.timing):
+                add_time(timing, phase, seconds)
+            location = page.headers.get('Location')
+            if page.code not in REDIRECT_CODES or not location:
+                break
+            page.read(DRAIN_SIZE)
+            if page.read(1):
+                # too long to be drained, the connection can't be reused
+                page.close()
+            url = six.moves.urllib.parse.urljoin(url, location)
+        else:
+            raise six.moves.urllib.error.HTTPError(url, page.code, "too many redirections", page.headers, page)
+
+        page.timing = timing
+        if page.code >= 400:
+            raise six.moves.urllib.error.HTTPError(url, page.code, page.reason, page.headers, page)
+        return page
@@ -0,0 +1,55 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import six
+
+import threading
+
+from wad.timing import timer
+
+PROFILE_TOP = 20  # patterns listed in the report
+
+
+class ClueProfile(object):
+    """
+    Statistics of matching clue patterns: number of calls, cumulative time and number of hits, for each
+    (app, clue type, pattern), e.g. ('Drupal', 'headers(X-Generator)', 'Drupal(?:\\s([\\d.]+))?\\;version:\\1')
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}  # (app, clue type, pattern) -> [calls, seconds, hits]
+
+    timer = staticmethod(timer)
+
+    def record(self, app, det, pattern, elapsed, hit):
+        key = (app, det, pattern)
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = [0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += hit
+
+    def by_clue_type(self):
+        """
+        :return: dict of (app, clue type without the key, e.g. 'headers') -> [calls, seconds, hits]
+        """
+        totals = {}
+        for (app, det, _), (calls, elapsed, hits) in six.iteritems(self.stats):
+            total = totals.setdefault((app, det.split('(')[0]), [0, 0.0, 0])
+            total[0] += calls
+            total[1] += elapsed
+            total[2] += hits
+        return totals
+
+    def report(self, top=PROFILE_TOP):
+        def lines(stats, describe):
+            most_expensive = sorted(six.iteritems(stats), key=lambda item: item[1][1], reverse=True)[:top]
+            return ["%10.2f ms %8d calls %5.1f%% hits  %s" %
+                    (elapsed * 1000, calls, 100.0 * hits / calls, describe(key))
+                    for key, (calls, elapsed, hits) in most_expensive]
+
+        with self.lock:
+            patterns = lines(self.stats, lambda key: "%s %s: %s" % key)
+            apps = lines(self.by_clue_type(), lambda key: "%s %s" % key)
+        return '\n'.join(["Most expensive clue patterns:"] + patterns +
+                         ["Most expensive apps and clue types:"] + apps)
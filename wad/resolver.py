@@ -0,0 +1,105 @@
+# DNS resolution with an in-process cache
+#
+# Hosts of all URLs are resolved concurrently before scanning, so that DNS latency isn't paid by each fetch,
+# and hosts which don't exist fail immediately instead of after a timeout.
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from multiprocessing.pool import ThreadPool
+import errno
+import logging
+import socket
+import threading
+import time
+
+from wad import tools
+
+# getaddrinfo() doesn't tell the TTL of DNS records, so results are cached for a fixed time
+DNS_TTL = 300
+DNS_WORKERS = 50  # hosts resolved at the same time
+# errors meaning that the host doesn't exist (rather than e.g. a temporary failure of the DNS server)
+NOT_FOUND_ERRORS = set(getattr(socket, name) for name in ('EAI_NONAME', 'EAI_NODATA') if hasattr(socket, name))
+
+
+class Resolver(object):
+    def __init__(self, ttl=DNS_TTL, workers=DNS_WORKERS):
+        self.ttl = ttl
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.cache = {}  # host -> (expiration time, getaddrinfo() results or gaierror if the host doesn't exist)
+
+    def lookup(self, host):
+        with self.lock:
+            expires, result = self.cache.get(host, (0, None))
+        if expires > time.time():
+            return result
+
+        try:
+            result = socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            if e.args[0] not in NOT_FOUND_ERRORS:
+                raise
+            result = e
+        with self.lock:
+            self.cache[host] = (time.time() + self.ttl, result)
+        return result
+
+    def resolve(self, host, port):
+        """
+        :return: getaddrinfo() results for the host and port, from the cache if possible
+        :raises socket.gaierror: if the host doesn't exist (also when cached), or it can't be resolved now
+        """
+        result = self.lookup(host)
+        if isinstance(result, socket.gaierror):
+            raise result
+        # the port is put into cached addresses: (address, port) for IPv4, (address, port, flow, scope) for IPv6
+        return [(family, socktype, proto, canonname, (sockaddr[0], port) + tuple(sockaddr[2:]))
+                for family, socktype, proto, canonname, sockaddr in result]
+
+    def resolve_all(self, hosts):
+        """
+        Resolves hosts concurrently, filling the cache
+        :return: set of hosts which don't exist
+        """
+        hosts = list(set(hosts) - set([None, ""]))
+        if not hosts:
+            return set()
+
+        def resolve(host):
+            try:
+                return host, isinstance(self.lookup(host), socket.gaierror)
+            except (socket.error, UnicodeError) as e:
+                logging.info("Error resolving %s: %s", host, tools.error_to_str(e))
+                return host, False
+
+        start = time.time()
+        pool = ThreadPool(min(self.workers, len(hosts)))
+        try:
+            not_found = set(host for host, missing in pool.imap_unordered(resolve, hosts) if missing)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        logging.info("Resolved %d hosts in %.1f s, %d of them don't exist", len(hosts), time.time() - start,
+                     len(not_found))
+        return not_found
+
+
+def connect_to(addresses, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, host=None):
+    """
+    Connects to the first of getaddrinfo() results which accepts the connection
+    :return: connected socket
+    """
+    error = None
+    for family, socktype, proto, _, sockaddr in addresses:
+        sock = None
+        try:
+            sock = socket.socket(family, socktype, proto)
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            sock.connect(sockaddr)
+            return sock
+        except socket.error as e:
+            error = e
+            if sock is not None:
+                sock.close()
+    raise error or socket.error(errno.EHOSTUNREACH, "no addresses for %s" % host)
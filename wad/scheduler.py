@@ -0,0 +1,81 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import six
+
+from collections import OrderedDict, deque
+import threading
+import time
+
+CONCURRENCY_PER_HOST = 4  # URLs scanned at the same time from a single host
+HOST_DELAY = 0  # minimum seconds between starting requests to a single host
+
+
+class HostScheduler(object):
+    """
+    Hands out URLs to scanning threads one by one, interleaving hosts (so that URLs of a single host, even if listed
+    together, are spread over the whole scan), so that each host has at most max_per_host URLs scanned at the same
+    time, started at least min_delay seconds apart.
+
+    A thread calls acquire() for the next URL (waiting if all remaining hosts are busy), and release() once it's
+    scanned. Redirections to other hosts are not taken into account.
+    """
+    def __init__(self, urls, max_per_host=CONCURRENCY_PER_HOST, min_delay=HOST_DELAY, clock=time.time, sleep=None):
+        """
+        :param clock: function giving the current time, in seconds
+        :param sleep: function waiting given seconds until the next host is ready after min_delay (by default,
+                      the wait is ended early by release() too); e.g. a fake clock's, in tests
+        """
+        self.max_per_host = max_per_host
+        self.min_delay = min_delay
+        self.clock = clock
+        self.sleep = sleep
+        # host -> its URLs not scanned yet; hosts are served in this order, each moved to the end once served
+        self.queues = OrderedDict()
+        for url in urls:
+            self.queues.setdefault(self.host(url), deque()).append(url)
+        self.active = dict((host, 0) for host in self.queues)
+        self.last_start = {}
+        self.condition = threading.Condition()
+
+    @staticmethod
+    def host(url):
+        return six.moves.urllib.parse.urlparse(url).netloc.lower()
+
+    def acquire(self):
+        """
+        :return: next URL to scan, None if there are no more
+        """
+        with self.condition:
+            while self.queues:
+                now = self.clock()
+                wait = None
+                for host in self.queues:
+                    if self.active[host] >= self.max_per_host:
+                        continue
+                    ready = self.last_start.get(host, now - self.min_delay) + self.min_delay
+                    if ready > now:
+                        wait = ready - now if wait is None else min(wait, ready - now)
+                        continue
+
+                    queue = self.queues.pop(host)
+                    url = queue.popleft()
+                    if queue:
+                        self.queues[host] = queue
+                    self.active[host] += 1
+                    self.last_start[host] = now
+                    return url
+
+                if self.sleep is not None and wait is not None:
+                    self.condition.release()
+                    try:
+                        self.sleep(wait)
+                    finally:
+                        self.condition.acquire()
+                else:
+                    # woken up by release(), or when the first host is ready after min_delay
+                    self.condition.wait(wait)
+            return None
+
+    def release(self, url):
+        with self.condition:
+            self.active[self.host(url)] -= 1
+            self.condition.notify_all()
@@ -0,0 +1,54 @@
+# Generated pages and scan results, for tests and benchmarks
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import random
+
+
+def synthetic_results(count, seed=0):
+    """
+    :return: results of scanning count URLs on count/50 hosts, with directories and files a few levels deep
+    """
+    rnd = random.Random(seed)
+    findings = [{'app': 'App%d' % i, 'ver': None, 'type': 'type%d' % (i % 5)} for i in range(30)]
+    results = {}
+    while len(results) < count:
+        segments = [rnd.choice('abcdefgh') for _ in range(rnd.randrange(5))]
+        if rnd.random() < 0.3:
+            segments.append(rnd.choice(['index.html', 'index.php', 'page.jsp']))
+        url = '%s://host%d.example.com/%s' % (rnd.choice(['http', 'https']), rnd.randrange(max(1, count // 50)),
+                                              '/'.join(segments))
+        results[url] = [dict(finding) for finding in rnd.sample(findings, 5)]
+    return results
+
+
+SYNTHETIC_SNIPPETS = [
+    '<div class="item-{0}"><p>Lorem ipsum dolor sit amet, consectetur adipiscing elit {0}.</p></div>\n',
+    '<a href="/page{0}.html" title="Page {0}">Page {0}</a>\n',
+    '<script src="/js/jquery-1.11.{0}.min.js"></script>\n',
+    '<script type="text/javascript">var item{0} = document.getElementById("item-{0}");</script>\n',
+    '<link rel="stylesheet" href="/wp-content/themes/theme{0}/style.css">\n',
+    '<img src="/images/photo{0}.jpg" alt="Photo {0}" width="100" height="100">\n',
+    '<table><tr><td>{0}</td><td>value {0}</td></tr></table>\n',
+]
+SYNTHETIC_SIZES = [10 * 1024, 100 * 1024, 1024 * 1024]
+
+
+def synthetic_pages(sizes=SYNTHETIC_SIZES, seed=0):
+    """
+    :return: list of generated pages of given sizes, as (name, url, headers, content)
+    """
+    rnd = random.Random(seed)
+    headers = {'Server': 'Apache/2.4.7 (Ubuntu)', 'X-Powered-By': 'PHP/5.5.9-1ubuntu4.4',
+               'Set-Cookie': 'PHPSESSID=0123456789abcdef; path=/', 'Content-Type': 'text/html; charset=UTF-8'}
+    pages = []
+    for size in sizes:
+        parts = ['<html><head><meta name="generator" content="WordPress 4.0"><title>Synthetic</title></head><body>\n']
+        length = len(parts[0])
+        while length < size:
+            part = rnd.choice(SYNTHETIC_SNIPPETS).format(rnd.randrange(1000))
+            parts.append(part)
+            length += len(part)
+        parts.append('</body></html>\n')
+        pages.append(('synthetic %d bytes' % size, 'http://www.example.com/index.php', headers,
+                      ''.join(parts)))
+    return pages
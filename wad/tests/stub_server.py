@@ -0,0 +1,102 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import six
+
+import threading
+import time
+
+
+class StubHandler(six.moves.BaseHTTPServer.BaseHTTPRequestHandler):
+    # HTTP/1.1, so that connections are kept alive
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        six.moves.BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append((time.time(), self.path))
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            if self.server.delay:
+                time.sleep(self.server.delay)
+            self.respond()
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def respond(self):
+        if self.path.startswith('/redirect'):
+            self.send_response(302)
+            self.send_header('Location', '/index.html')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.path.startswith('/chunked'):
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i in range(0, len(self.server.body), 10):
+                chunk = self.server.body[i:i + 10]
+                self.wfile.write(b'%x\r\n' % len(chunk) + chunk + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+            return
+
+        if self.server.etag and self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        status = 404 if self.path.startswith('/missing') else 200
+        body = self.server.body if status == 200 else b'not found'
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html')
+        if self.server.etag:
+            self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def version_string(self):
+        return 'Apache/2.4.7 (Ubuntu)'
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(six.moves.socketserver.ThreadingMixIn, six.moves.BaseHTTPServer.HTTPServer):
+    """
+    Local HTTP server for tests, counting connections and concurrent requests, and recording (time, path) of
+    requests
+    """
+    daemon_threads = True
+
+    def __init__(self, body=b'<html><script src="jquery.min.js"></script></html>', delay=0, etag=None):
+        six.moves.BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.body = body
+        self.delay = delay
+        # if set, pages have this ETag, and requests with a matching If-None-Match get 304 Not Modified
+        self.etag = etag
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/' % self.server_address[1]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
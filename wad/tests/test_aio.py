@@ -0,0 +1,110 @@
+# Python 3.6+ only (see conftest.py)
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import asyncio
+import threading
+
+import pytest
+
+from wad.aio import AsyncDetector, FetchError
+from wad.tests.stub_server import StubServer
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def apps(results, url):
+    return set(f['app'] for f in results[url])
+
+
+def test_detect_async():
+    detector = AsyncDetector()
+    with StubServer() as server:
+        results = run(detector.detect_async(server.url + 'redirect'))
+        assert list(results) == [server.url + 'index.html']
+        assert apps(results, server.url + 'index.html') == set(['Apache', 'jQuery', 'Ubuntu'])
+
+        results = run(detector.detect_async(server.url + 'chunked'))
+        assert apps(results, server.url + 'chunked') == set(['Apache', 'jQuery', 'Ubuntu'])
+        assert detector.metadata[server.url + 'chunked'] == {'size': len(server.body), 'truncated': False}
+
+        # error pages are analyzed too
+        results = run(detector.detect_async(server.url + 'missing'))
+        assert apps(results, server.url + 'missing') == set(['Apache', 'Ubuntu'])
+
+        # expected_url is checked after redirection
+        assert run(detector.detect_async(server.url + 'redirect', exclude='.*index')) == {}
+    url = server.url
+    assert run(detector.detect_async(url)) == {}
+
+
+def test_detect_async_truncated():
+    detector = AsyncDetector(max_content_size=20)
+    with StubServer() as server:
+        for path in ['', 'chunked']:
+            run(detector.detect_async(server.url + path))
+            assert detector.metadata[server.url + path] == {'size': 20, 'truncated': True}
+
+
+def test_read_body_large_chunk():
+    # a chunk larger than max_content_size is read only up to it, without waiting for the rest
+    detector = AsyncDetector(max_content_size=1000)
+
+    async def read_body(data, eof=False):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        if eof:
+            reader.feed_eof()
+        return await detector.read_body({'Transfer-Encoding': 'chunked'}, reader, 0.5)
+
+    assert run(read_body(b'%x\r\n' % (40 * 1024 * 1024) + b'a' * 5000)) == (b'a' * 1000, True)
+    assert run(read_body(b'3e8\r\n' + b'a' * 1000 + b'\r\n0\r\n\r\n', eof=True)) == (b'a' * 1000, False)
+
+
+def test_detect_multiple_async():
+    detector = AsyncDetector(concurrency=10, concurrency_per_host=2)
+    with StubServer(delay=0.05) as server:
+        urls = [server.url + 'page%d.html' % i for i in range(10)] + [None, '', 'ftp://abc.xyz/']
+        results = run(detector.detect_multiple_async(urls))
+    assert sorted(results) == sorted(urls[:10])
+    assert server.max_in_flight == 2
+
+
+def test_analyze_in_thread():
+    # pages are analyzed outside of the event loop's thread
+    detector = AsyncDetector()
+    threads = []
+    analyze = detector.analyze
+
+    def record_thread(*args):
+        threads.append(threading.current_thread())
+        return analyze(*args)
+    detector.analyze = record_thread
+    with StubServer() as server:
+        results = run(detector.detect_async(server.url))
+    assert apps(results, server.url) == set(['Apache', 'jQuery', 'Ubuntu'])
+    assert threads and threads[0] is not threading.current_thread()
+
+
+def test_invalid_status_line():
+    async def respond(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 abc OK\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def fetch():
+        server = await asyncio.start_server(respond, '127.0.0.1', 0)
+        try:
+            url = 'http://127.0.0.1:%d/' % server.sockets[0].getsockname()[1]
+            with pytest.raises(FetchError):
+                await AsyncDetector().fetch(url, 3)
+            return await AsyncDetector().detect_async(url)
+        finally:
+            server.close()
+    assert run(fetch()) == {}
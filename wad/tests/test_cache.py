@@ -0,0 +1,108 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import mock
+import os
+import shutil
+import tempfile
+
+from wad.cache import FindingsMemo, ResponseCache
+from wad.detection import Detector
+from wad.tests.stub_server import StubServer
+
+
+def test_response_cache():
+    tempdir = tempfile.mkdtemp()
+    try:
+        with StubServer(etag='"v1"') as server:
+            url = server.url + 'index.html'
+            cache = ResponseCache(tempdir)
+            results = Detector(cache=cache).detect(url)
+            assert set(f['app'] for f in results[url]) >= set(['Apache', 'jQuery', 'Ubuntu'])
+
+            # fresh response: neither fetched nor analyzed again
+            with mock.patch.object(Detector, 'analyze') as analyze:
+                assert Detector(cache=ResponseCache(tempdir)).detect(url) == results
+            assert not analyze.called
+            assert len(server.requests) == 1
+
+            # stale response: revalidated, and still not analyzed again
+            with mock.patch.object(Detector, 'analyze') as analyze:
+                assert Detector(cache=ResponseCache(tempdir, ttl=0)).detect(url) == results
+            assert not analyze.called
+            assert len(server.requests) == 2
+
+            # changed page
+            server.etag = '"v2"'
+            server.body = b'<html></html>'
+            results = Detector(cache=ResponseCache(tempdir, ttl=0)).detect(url)
+            assert 'jQuery' not in set(f['app'] for f in results[url])
+            assert len(server.requests) == 3
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_response_cache_clues_changed():
+    tempdir = tempfile.mkdtemp()
+    try:
+        with StubServer() as server:
+            Detector(cache=ResponseCache(tempdir)).detect(server.url)
+            with mock.patch('wad.clues.Clues.digest', 'other clues'):
+                results = Detector(cache=ResponseCache(tempdir)).detect(server.url)
+        # analyzed again, but not fetched again
+        assert len(server.requests) == 1
+        assert 'jQuery' in set(f['app'] for f in results[server.url])
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_response_cache_not_stored():
+    tempdir = tempfile.mkdtemp()
+    try:
+        with StubServer() as server:
+            cache = ResponseCache(tempdir)
+            Detector(cache=cache).detect(server.url + 'missing')
+            Detector(cache=cache, max_content_size=10).detect(server.url)
+            # neither the error page nor the truncated page is cached
+            assert os.listdir(tempdir) == []
+            Detector(cache=cache).detect(server.url)
+            assert cache.get(server.url) is not None
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_response_cache_revalidated():
+    entry = {'headers': [('Content-Length', '1234'), ('Date', 'old'), ('ETag', '"v1"')]}
+    revalidated = ResponseCache.revalidated(entry, [('Date', 'new'), ('Content-Length', '0'),
+                                                     ('Cache-Control', 'max-age=60')])
+    assert revalidated['headers'] == [('Content-Length', '1234'), ('ETag', '"v1"'), ('Date', 'new'),
+                                      ('Cache-Control', 'max-age=60')]
+    assert entry['headers'][1] == ('Date', 'old')
+
+
+def test_response_cache_eviction():
+    tempdir = tempfile.mkdtemp()
+    try:
+        with StubServer(body=os.urandom(10000)) as server:
+            cache = ResponseCache(tempdir, max_size=25000)
+            detector = Detector(cache=cache)
+            for i in range(5):
+                detector.detect(server.url + 'page%d.html' % i)
+            assert cache.size <= 25000
+            assert cache.size == sum(os.path.getsize(os.path.join(tempdir, name)) for name in os.listdir(tempdir))
+            # the most recent page is kept
+            assert cache.get(server.url + 'page4.html') is not None
+            assert cache.get(server.url + 'page0.html') is None
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_findings_memo():
+    memo = FindingsMemo(size=2)
+    memo.put('a', [{'app': 'A', 'ver': None}])
+    memo.put('b', [{'app': 'B', 'ver': None}])
+    assert memo.get('a') == [{'app': 'A', 'ver': None}]
+    # 'b' is the least recently used one
+    memo.put('c', [{'app': 'C', 'ver': None}])
+    assert memo.get('b') is None
+    assert memo.get('c') == [{'app': 'C', 'ver': None}]
+    assert (memo.hits, memo.misses) == (2, 1)
@@ -1,10 +1,20 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 import six
 
+import logging
+import pickle
 import re
 import os
+import shutil
+import sre_constants
+import sre_parse
+import tempfile
+
+import mock
+import pytest
+
 from wad import tools
-from wad.clues import _Clues
+from wad.clues import _Clues, AppRelations, ClueTable, LazyRegexp
 import itertools
 
 CLUES_FILE = os.path.join(os.path.dirname(__file__), '../etc/apps.json')
@@ -83,10 +93,24 @@ def test_clues_correct():
 
 
 def test_compile_clue():
-    assert _Clues.compile_clue('abc') == {"re": re.compile("abc", flags=re.I)}
-    assert _Clues.compile_clue(r'abc\;version:$1') == {"re": re.compile("abc", flags=re.I), "version": "$1"}
-    assert _Clues.compile_clue(r'ab;c\;k:v1:v2\;aaa') == {"re": re.compile("ab;c", flags=re.I),
+    assert _Clues.compile_clue('abc') == {"re": LazyRegexp("abc", flags=re.I)}
+    assert _Clues.compile_clue(r'abc\;version:$1') == {"re": LazyRegexp("abc", flags=re.I), "version": "$1"}
+    assert _Clues.compile_clue(r'ab;c\;k:v1:v2\;aaa') == {"re": LazyRegexp("ab;c", flags=re.I),
                                                           "k": "v1:v2", "aaa": None}
+    with pytest.raises(sre_constants.error):
+        _Clues.compile_clue('(abc')
+
+
+def test_lazy_regexp():
+    regexp = LazyRegexp('a(b+)', re.I)
+    assert regexp.compiled is None
+    assert regexp.search('xABb').group(1) == 'Bb'
+    assert regexp.match('xab') is None
+    assert regexp.compiled is not None
+    # pickled without the compiled regexp
+    unpickled = pickle.loads(pickle.dumps(regexp, protocol=2))
+    assert unpickled == regexp and unpickled.compiled is None
+    assert unpickled.search('ab').group(0) == 'ab'
 
 
 def test_compile_clues():
@@ -119,3 +143,203 @@ def test_compile_clues():
     assert (set([v for (_, k, v) in fields if k == 'version']) ==
             set(['7', '\\1', '\\1?Enterprise:Community', '\\1.\\2.\\3', '\\1 \\2', '2+', '\\1?4:5',
                 '\\1?\\1:\\2', 'API v\\1', '\\1?opt-in:', '2', '\\1?2+:']))
+
+
+def test_clue_triggers():
+    assert _Clues.clue_triggers('wp-content/themes/([^/]+)') == ('wp-content/themes/',)
+    assert _Clues.clue_triggers('<div id="Gallery') == ('<div id="gallery',)
+    assert _Clues.clue_triggers('jquery\\.js') == ('jquery.js',)
+    assert _Clues.clue_triggers('<[^>]+data-bem') == ('data-bem',)
+    assert _Clues.clue_triggers('^https?://[^/]+\\.blogspot\\.com') == ('.blogspot.com',)
+    assert _Clues.clue_triggers('<(?:link|style)[^>]+"/sites/') == ('"/sites/',)
+    assert _Clues.clue_triggers('(?:Powered by CubeCart|<p[^>]+>CubeCart)') == ('>cubecart', 'powered by cubecart')
+    assert _Clues.clue_triggers('(?:x(abcd)+|y(efg)?)') is None
+    assert _Clues.clue_triggers('^https?://') == ('http',)
+    assert _Clues.clue_triggers('[0-9]+x?') is None
+    assert _Clues.clue_triggers('(?:a|b)c') is None
+
+
+def test_nested_quantifiers():
+    def nested(regexp):
+        return _Clues.nested_quantifiers(sre_parse.parse(regexp))
+    assert nested('(a+)+')
+    assert nested('(?:[^/]+/)*content/')
+    assert nested('^IMPERIA ([0-9.]{2,})+$')
+    assert nested('(?:x|(\\w+\\s?)*)y')
+    assert nested('(?=(a*)*)')
+    assert not nested('wp-content/themes/([^/]+)')
+    assert not nested('(a+)?b')
+    assert not nested('(a{1,3}){2,5}')
+    assert not nested('(ab)+')
+
+
+def test_risky_patterns():
+    clues = _Clues()
+    clues.load_clues(CLUES_FILE)
+    clues.compile_clues()
+    assert ('Bloomreach', 'html', 0) in clues.risky
+    assert ('imperia CMS', 'meta', 'GENERATOR') in clues.risky
+    assert clues.apps['Bloomreach']['html_re'][0]['re'] in clues.risky_regexps
+    assert clues.apps['jQuery']['script_re'][0]['re'] not in clues.risky_regexps
+
+
+def test_byte_safe():
+    def safe(regexp):
+        return _Clues.byte_safe(sre_parse.parse(regexp))
+    assert safe('wp-content/themes/([^/]+)')
+    assert safe('<div[^>]+id="gallery-([\\d.]+)')
+    assert safe('(?:x|y(?=z))\\.js$')
+    assert not safe('<!--\\s+Powered by GX')
+    assert not safe('\\bwebix\\.js')
+    assert not safe('Generated by (\\w+)')
+    assert not safe('caf\xe9')
+    assert not safe('[a-\xff]+')
+
+
+def test_joinable():
+    def joinable(regexp):
+        return _Clues.joinable(sre_parse.parse(regexp))
+    assert joinable('jquery[.-]([\\d.]*\\d)[^/]*\\.js')
+    assert joinable('^https?://cdn\\.aircall\\.io/')
+    assert joinable('(?:x|\\bmoon(?:\\.min)?\\.js$)')
+    assert not joinable('^https?://(?!o\\.)\\w+\\.advg\\.jp/')
+    assert not joinable('(?<=/)list\\.js')
+    assert not joinable('\\Alist\\.js\\Z')
+
+    clues = _Clues()
+    clues.load_clues(CLUES_FILE)
+    clues.compile_clues()
+    joined = clues.apps['Moon']['script_re'][0]['re']
+    assert clues.joined_regexps[joined].flags & re.MULTILINE
+    assert clues.joined_regexps[joined].pattern == joined.pattern
+    assert clues.apps['ADPLAN']['script_re'][1]['re'] not in clues.joined_regexps
+
+
+def test_bytes_regexps():
+    clues = _Clues()
+    clues.load_clues(CLUES_FILE)
+    clues.compile_clues()
+    bytes_regexps = clues.get_bytes_regexps()
+    html_regexps = [regex_dict['re'] for app in clues.apps for regex_dict in clues.apps[app].get('html_re', [])]
+    assert len(html_regexps) * 0.8 < len(bytes_regexps) < len(html_regexps)
+    for regexp, bytes_re in bytes_regexps.items():
+        assert bytes_re.pattern == regexp.pattern.encode('ascii')
+    # risky patterns stay risky
+    risky = clues.apps['Bloomreach']['html_re'][0]['re']
+    if risky in bytes_regexps:
+        assert bytes_regexps[risky] in clues.risky_regexps
+
+
+def test_clue_tables():
+    clues = _Clues()
+    clues.load_clues(CLUES_FILE)
+    clues.compile_clues()
+
+    for key in ['script', 'html', 'url']:
+        table = clues.tables[key]
+        assert len(table.entries) == sum(len(clues.apps[app][key]) for app in clues.apps if key in clues.apps[app])
+
+        # candidates are a subset of the table, so they never miss a clue which matches
+        text = '<html><div id="gsNavBar" class="gcBorder1"><script src="jquery.min.js"> http://x.blogspot.com/'
+        candidates = table.candidates(text)
+        for app, i, _ in table.entries:
+            if clues.apps[app][key + '_re'][i]['re'].search(text):
+                assert (app, i) in candidates
+        assert len(candidates) < len(table.entries)
+        assert table.candidates(text.encode('latin-1')) == candidates
+
+
+def test_clue_table_triggers():
+    # overlapping triggers, and triggers which are prefixes of others, are all found
+    table = ClueTable([('A', 0, ('abc',)), ('B', 0, ('cde',)), ('C', 0, ('abcdx', 'ab')), ('D', 0, None),
+                       ('E', 0, ('xyz',)), ('F', 0, ('bcd',))])
+    assert table.candidates('_ABCDE_') == [('A', 0), ('B', 0), ('C', 0), ('D', 0), ('F', 0)]
+    assert table.candidates(b'_abcdx') == [('A', 0), ('C', 0), ('D', 0), ('F', 0)]
+    assert table.candidates('') == [('D', 0)]
+    assert ClueTable([]).candidates('abc') == []
+
+
+def test_keyed_tables():
+    clues = _Clues()
+    clues.load_clues(CLUES_FILE)
+    clues.compile_clues()
+
+    assert ('IIS', 'Server') in clues.keyed_tables['headers']['server']
+    assert ('X-Cart', 'xid') in clues.keyed_tables['cookies']['xid']
+    assert ('Percussion', 'generator') in clues.keyed_tables['meta']['generator']
+    for key in ['headers', 'cookies', 'meta']:
+        assert (sum(len(entries) for entries in clues.keyed_tables[key].values()) ==
+                sum(len(clues.apps[app][key]) for app in clues.apps if key in clues.apps[app]))
+
+
+def test_app_relations():
+    apps = {
+        'A': {'implies': ['B', 'Missing']},
+        'B': {'implies': ['C'], 'excludes': ['D']},
+        'C': {'implies': ['A', 'D']},
+        'D': {},
+    }
+    relations = AppRelations(apps)
+    assert relations.names == ['A', 'B', 'C', 'D']
+
+    def names(indexes):
+        return [relations.names[i] for i in indexes]
+    # transitive, nearest first, without cycles and unknown apps
+    assert names(relations.implies[relations.index['A']]) == ['B', 'C', 'D']
+    assert names(relations.implies[relations.index['C']]) == ['A', 'D', 'B']
+    assert names(relations.implies[relations.index['D']]) == []
+    assert names(relations.excludes[relations.index['B']]) == ['D']
+
+
+def test_clues_cache(caplog):
+    cache_dir = tempfile.mkdtemp()
+    try:
+        clues_file = os.path.join(cache_dir, 'apps.json')
+        shutil.copy(CLUES_FILE, clues_file)
+
+        cold = _Clues()
+        cold.get_clues(clues_file, cache_dir=cache_dir)
+        cache_name = '%s%s.pickle' % (_Clues.cache_prefix(clues_file), cold.digest)
+        cache_files = [name for name in os.listdir(cache_dir) if name.startswith('clues-')]
+        assert cache_files == [cache_name]
+
+        cached = _Clues()
+        with mock.patch.object(_Clues, 'load_clues') as load_clues, caplog.at_level(logging.INFO):
+            cached.get_clues(clues_file, cache_dir=cache_dir)
+            assert not load_clues.called
+        # risky patterns are logged as well
+        assert 'has nested quantifiers' in caplog.text
+        assert cached.apps == cold.apps
+        assert cached.categories == cold.categories
+        assert cached.tables['html'].entries == cold.tables['html'].entries
+        assert cached.keyed_tables == cold.keyed_tables
+        assert cached.relations.implies == cold.relations.implies
+        # regexps are only compiled when used
+        regexp = cached.apps['jQuery']['script_re'][0]['re']
+        assert regexp.compiled is None
+        assert regexp.search('/js/jquery-1.11.1.min.js')
+        assert cached.apps['Bloomreach']['html_re'][0]['re'] in cached.risky_regexps
+        assert cached.joined_regexps == cold.joined_regexps
+
+        # changing clues invalidates the cache
+        with open(clues_file + '.other', 'w') as f:
+            f.write('{"categories": {}, "apps": {"Foo": {"cats": [1], "html": "foo-bar"}}}')
+        changed = _Clues()
+        changed.get_clues(clues_file, cache_dir=cache_dir)
+        assert changed.digest != cold.digest
+        assert 'Foo' in changed.apps
+        assert cache_name not in os.listdir(cache_dir)
+
+        # caches of other clues files are kept
+        other_file = os.path.join(cache_dir, 'other.json')
+        shutil.copy(CLUES_FILE, other_file)
+        _Clues().get_clues(other_file, cache_dir=cache_dir)
+        changed_name = '%s%s.pickle' % (_Clues.cache_prefix(clues_file), changed.digest)
+        assert changed_name in os.listdir(cache_dir)
+        assert len([name for name in os.listdir(cache_dir) if name.startswith('clues-')]) == 2
+
+        # as well as changes of the code building them
+        with mock.patch.object(_Clues, 'code_digest', return_value=b'changed'):
+            assert _Clues.clues_digest(clues_file) != changed.digest
+    finally:
+        shutil.rmtree(cache_dir)
@@ -1,15 +1,26 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 import six
 
+from email.message import Message
 import copy
 import unittest
 import mock
 import operator
+import random
 
-from wad.detection import Detector, TIMEOUT
+from wad import detection
+from wad.detection import Detector, TIMEOUT, CHUNK_SIZE
+from wad.finding import Finding
+from wad.tests.stub_server import StubServer
 from wad.tests.data.data_test_wad import cern_ch_test_data
 
 
+class CustomDetector(Detector):
+    # a check of a subclass, used by processes of the matching pool too
+    def check_meta(self, content):
+        return Detector.check_meta(self, content) + [Finding('Drupal', str(self.match_timeout))]
+
+
 class TestDetector(unittest.TestCase):
     def setUp(self):
         self.detector = Detector()
@@ -21,9 +32,9 @@ class TestDetector(unittest.TestCase):
             page = mock.MagicMock()
             page.geturl.return_value = url
             if six.PY3:
-                page.read.return_value = bytes(content, encoding='utf-8')
+                page.read.side_effect = six.BytesIO(bytes(content, encoding='utf-8')).read
             else:
-                page.read.return_value = content
+                page.read.side_effect = six.BytesIO(content).read
             page.info.return_value = headers or dict()
             mockObj.urlopen = mock.Mock(return_value=page)
             results = self.detector.detect('http://abc.xyz')
@@ -37,7 +48,7 @@ class TestDetector(unittest.TestCase):
             self.apps['IIS']['headers_re']['Server'],
             self.apps['IIS']['headers']['Server'],
             'Microsoft-IIS/7.5',
-            [], None, 'IIS') == [{'app': 'IIS', 'ver': '7.5'}])
+            [], None, 'IIS') == [Finding('IIS', '7.5')])
 
         # (?:maps\\.google\\.com/maps\\?file=api(?:&v=([\\d.]+))?|
         # maps\\.google\\.com/maps/api/staticmap)\\;version:API v\\1
@@ -45,7 +56,7 @@ class TestDetector(unittest.TestCase):
             self.apps['Google Maps']['script_re'][0],
             self.apps['Google Maps']['script'][0],
             'abc <script src="maps.google.com/maps?file=api&v=123"> def',
-            [], None, 'Google Maps') == [{'app': 'Google Maps', 'ver': 'API v123'}])
+            [], None, 'Google Maps') == [Finding('Google Maps', 'API v123')])
 
         # "script": [ "js/mage", "skin/frontend/(?:default|(enterprise))\\;version:\\1?Enterprise:Community" ],
         assert (self.detector.check_re(
@@ -58,54 +69,84 @@ class TestDetector(unittest.TestCase):
             self.apps['Magento']['script_re'][1],
             self.apps['Magento']['script'][1],
             'abc <script src="skin/frontend/default"> def',
-            [], None, 'Magento') == [{'app': 'Magento', 'ver': 'Community'}])
+            [], None, 'Magento') == [Finding('Magento', 'Community')])
 
         assert (self.detector.check_re(
             self.apps['Magento']['script_re'][1],
             self.apps['Magento']['script'][1],
             'abc <script src="skin/frontend/enterprise"> def',
-            [], None, 'Magento') == [{'app': 'Magento', 'ver': 'Enterprise'}])
+            [], None, 'Magento') == [Finding('Magento', 'Enterprise')])
+
+        # check_re is static, and matches without the detector's settings
+        assert (Detector.check_re(
+            self.apps['IIS']['headers_re']['Server'],
+            self.apps['IIS']['headers']['Server'],
+            'Microsoft-IIS/7.5',
+            [], None, 'IIS') == [Finding('IIS', '7.5')])
 
     def test_check_url(self):
-        assert self.detector.check_url("http://whatever.blogspot.com") == [{'app': 'Blogger', 'ver': None}]
-        assert self.detector.check_url("https://whatever-else3414.de/script.php") == [{'app': 'PHP', 'ver': None}]
+        assert self.detector.check_url("http://whatever.blogspot.com") == [Finding('Blogger', None)]
+        assert self.detector.check_url("https://whatever-else3414.de/script.php") == [Finding('PHP', None)]
 
     def test_check_html(self):
         content = '<html><div id="gsNavBar" class="gcBorder1">whatever'
-        assert self.detector.check_html(content) == [{'app': 'Gallery', 'ver': None}]
+        assert self.detector.check_html(content) == [Finding('Gallery', None)]
 
     def test_check_meta(self):
         assert (self.detector.check_meta('<html>    s<meta name="generator" content="Percussion">sssss    whatever') ==
-                [{'app': 'Percussion', 'ver': None}])
+                [Finding('Percussion', None)])
         assert (self.detector.check_meta(" dcsaasd f<meta   name    = 'cargo_title' dd  content  =   'Pdafadfda'  >") ==
-                [{'app': 'Cargo', 'ver': None}])
+                [Finding('Cargo', None)])
         assert (self.detector.check_meta(" dcsaasd f<mfffffffeta     name='cargo_title' dd  content='Pdafadfda'  >") ==
                 [])
         assert self.detector.check_meta(" dcsaasd f<meta     name='cargo_title' >") == []
 
     def test_check_script(self):
         assert (self.detector.check_script('<html>    s<script  sda f     src    =  "jquery1.7.js">') ==
-                [{'app': 'jQuery', 'ver': None}])
+                [Finding('jQuery', None)])
         assert self.detector.check_script(" dcsaasd f<script     src='' >") == []
 
+    def test_check_script_joined(self):
+        # the same findings, in the same order, as from checking each source alone - also for clues which are
+        # anchored (^, $), have lookarounds or are matched with a time limit, and sources containing newlines
+        srcs = ['/js/jquery-1.11.2.min.js', '//static.hotjar.com/c/hotjar-1.js?sv=5', 'immutable.min.js',
+                'https://ajax.googleapis.com/ajax/libs/angularjs/1.4.8/angular.min.js', '/moon.min.js', 'list.min.js',
+                'https://cdnjs.cloudflare.com/ajax/libs/video.js/5.0.2/video.js', '/static/mobx.umd.min.js',
+                '/wp-content/plugins/gravityforms/js/forms.js?ver=2.4.1', '/js/awesomplete.js?x', '/js/app.js',
+                'https://www.google-analytics.com/analytics.js', '/js/bootstrap.min.js', 'x/immutable.min.js']
+        rnd = random.Random(0)
+        for n in range(100):
+            page_srcs = [rnd.choice(srcs) for _ in range(rnd.randrange(10))]
+            if n % 10 == 0:
+                page_srcs.append('/js/jquery-1.11.2.min.js\n/moon.min.js')
+            content = ''.join('<script src="%s"></script>' % src for src in page_srcs)
+            expected = []
+            for src in page_srcs:
+                expected.extend(self.detector.check_tag(data=src, key='script', key_re='script_re'))
+            found = self.detector.check_script(content)
+            assert [(f.app, f.ver, f.det) for f in found] == [(f.app, f.ver, f.det) for f in expected]
+
     def test_check_headers(self):
         headers = [('Host', 'abc.com'), ('Server', 'Linux Ubuntu 12.10')]
         headers_mock = mock.Mock()
         headers_mock.items.return_value = headers
 
         assert (self.detector.check_headers(headers_mock) ==
-                [{'app': 'Ubuntu', 'ver': None}])
+                [Finding('Ubuntu', None)])
 
     def test_check_cookies(self):
         headers = {'Set-Cookie': 'x=1; xid=%s; y=2' % ('a'*32)}
 
         assert (self.detector.check_cookies(headers) ==
-                [{'app': 'X-Cart', 'ver': None}])
+                [Finding('X-Cart', None)])
 
     def test_implied_by(self):
         # ASP implies WS and IIS and IIS implies WS;
         # but we already know about IIS, so the only new implied app is WS
         assert self.detector.implied_by(['Microsoft ASP.NET', 'IIS']) == {'Windows Server'}
+        # apps implied by implied apps are included too
+        assert self.detector.implied_by(['Microsoft ASP.NET']) == {'IIS', 'Windows Server'}
+        assert self.detector.implied_by(['Not an app']) == set()
 
     def test_follow_implies(self):
         # empty findings
@@ -114,40 +155,94 @@ class TestDetector(unittest.TestCase):
         assert findings == []
 
         # no implies
-        findings = [{'app': 'reCAPTCHA', 'ver': None}]
+        findings = [Finding('reCAPTCHA', None)]
         self.detector.follow_implies(findings)
-        assert findings == [{'app': 'reCAPTCHA', 'ver': None}]
+        assert findings == [Finding('reCAPTCHA', None)]
 
         # Django CMS implies Django, and Django implies Python - let's see if this chain is followed
-        findings = [{'app': 'Django CMS', 'ver': None}]
+        findings = [Finding('Django CMS', None)]
         self.detector.follow_implies(findings)
         assert (findings ==
-                [{'app': 'Django CMS', 'ver': None},
-                 {'app': 'Django', 'ver': None},
-                 {'app': 'Python', 'ver': None}])
+                [Finding('Django CMS', None),
+                 Finding('Django', None),
+                 Finding('Python', None)])
 
     def test_remove_duplicates(self):
         with_duplicates = [
-            {'app': 'A', 'ver': None}, {'app': 'B', 'ver': "1.5"},
-            {'app': 'C', 'ver': None}, {'app': 'D', 'ver': "7.0"},
-            {'app': 'E', 'ver': "1"}, {'app': 'F', 'ver': "2.2"},
-            {'app': 'A', 'ver': None}, {'app': 'B', 'ver': "1.5"},
-            {'app': 'C', 'ver': "be"}, {'app': 'D', 'ver': "222"},
-            {'app': 'A', 'ver': None}, {'app': 'B', 'ver': "1.5"},
-            {'app': 'E', 'ver': None}, {'app': 'E', 'ver': "1.3"},
-            {'app': 'F', 'ver': "2"}, {'app': 'F', 'ver': None},
+            Finding('A', None), Finding('B', "1.5"),
+            Finding('C', None), Finding('D', "7.0"),
+            Finding('E', "1"), Finding('F', "2.2"),
+            Finding('A', None), Finding('B', "1.5"),
+            Finding('C', "be"), Finding('D', "222"),
+            Finding('A', None), Finding('B', "1.5"),
+            Finding('E', None), Finding('E', "1.3"),
+            Finding('F', "2"), Finding('F', None),
         ]
 
         without_duplicates = [
-            {'app': 'A', 'ver': None}, {'app': 'B', 'ver': "1.5"},
-            {'app': 'C', 'ver': "be"}, {'app': 'D', 'ver': "7.0"},
-            {'app': 'E', 'ver': "1.3"},
-            {'app': 'F', 'ver': "2.2"}, {'app': 'D', 'ver': "222"},
+            Finding('A', None), Finding('B', "1.5"),
+            Finding('C', "be"), Finding('D', "7.0"),
+            Finding('E', "1.3"),
+            Finding('F', "2.2"), Finding('D', "222"),
         ]
 
         Detector().remove_duplicates(with_duplicates)
         assert with_duplicates == without_duplicates
 
+    @unittest.skipIf(six.PY2, "content isn't decoded on Python 2")
+    def test_match_bytes(self):
+        # the same findings from raw content as from the decoded one, also with non-ASCII characters around
+        # (which \\w, \\s etc. match in decoded content only) and with clues which have to be matched on it
+        raw_detector = Detector(match_bytes=True)
+        noise = ''.join(chr(c) for c in range(0x80, 0x100)) * 3
+        contents = [cern_ch_test_data['content'], noise + cern_ch_test_data['content'] + noise,
+                    '<html amp\xa0>\xe9<script src="/js/jquery-1.11.2.min.js"><!--\xa0 Powered by GX']
+        for content in contents:
+            findings = self.detector.findings(cern_ch_test_data['geturl'], cern_ch_test_data['headers'], content)
+            raw_findings = raw_detector.findings(cern_ch_test_data['geturl'], cern_ch_test_data['headers'],
+                                                 content.encode('latin-1'))
+            assert [(f.app, f.ver, f.det) for f in raw_findings] == [(f.app, f.ver, f.det) for f in findings]
+            assert findings
+
+        # the whole page is decoded only for additional checks of subclasses
+        class Additional(Detector):
+            def additional_checks(self, page, url, content):
+                return [{'app': 'Custom', 'ver': content[:6], 'type': None}]
+        page = mock.Mock()
+        page.info.return_value = cern_ch_test_data['headers']
+        raw = cern_ch_test_data['content'].encode('latin-1')
+        assert raw_detector.analyze(page, cern_ch_test_data['geturl'], raw) == self.detector.analyze(
+            page, cern_ch_test_data['geturl'], raw)
+        assert Additional(match_bytes=True).analyze(page, cern_ch_test_data['geturl'], raw)[-1]['ver'] == '<!DOCT'
+
+    def test_remove_duplicates_legacy(self):
+        # the same as the previous pairwise merging of findings
+        def legacy(findings):
+            temp = copy.deepcopy(findings)
+            findings[:] = []
+            for t in temp:
+                already = False
+                for f in findings:
+                    if t == f:
+                        already = True
+                    elif t['app'] == f['app']:
+                        if f['ver'] is None or (t['ver'] is not None and t['ver'].find(f['ver']) == 0):
+                            f['ver'] = t['ver']
+                            already = True
+                        elif t['ver'] is None or f['ver'].find(t['ver']) == 0:
+                            already = True
+                if not already:
+                    findings += [t]
+
+        rng = random.Random(0)
+        versions = [None, '1', '1.2', '1.2.3', '1.3', '2', '22', '2.0']
+        for _ in range(500):
+            findings = [Finding(rng.choice('ABC'), rng.choice(versions), 'html') for _ in range(rng.randint(0, 8))]
+            dicts = [{'app': f.app, 'ver': f.ver} for f in findings]
+            Detector.remove_duplicates(findings)
+            legacy(dicts)
+            assert [{'app': f.app, 'ver': f.ver} for f in findings] == dicts
+
     def test_excluded_by(self):
         # both 'Neos Flow' and 'Neos CMS' exclude 'TYPO3 CMS'
         assert self.detector.excluded_by(['Neos Flow', 'Neos CMS']) == ['TYPO3 CMS']
@@ -163,36 +258,71 @@ class TestDetector(unittest.TestCase):
         assert findings == []
 
         # no implies
-        findings = [{'app': 'reCAPTCHA', 'ver': None}]
+        findings = [Finding('reCAPTCHA', None)]
         self.detector.remove_exclusions(findings)
-        assert findings == [{'app': 'reCAPTCHA', 'ver': None}]
+        assert findings == [Finding('reCAPTCHA', None)]
 
         # real exclusions
-        findings = [{'app': 'JBoss Web', 'ver': None},
-                    {'app': 'Apache Tomcat', 'ver': None},
-                    {'app': 'IIS', 'ver': None},
-                    {'app': 'TYPO3 CMS', 'ver': None},
-                    {'app': 'Neos Flow', 'ver': None}]
+        findings = [Finding('JBoss Web', None),
+                    Finding('Apache Tomcat', None),
+                    Finding('IIS', None),
+                    Finding('TYPO3 CMS', None),
+                    Finding('Neos Flow', None)]
         self.detector.remove_exclusions(findings)
         assert (findings ==
-                [{'app': 'JBoss Web', 'ver': None},
-                 {'app': 'IIS', 'ver': None},
-                 {'app': 'Neos Flow', 'ver': None}])
-
-    def test_add_categories(self):
+                [Finding('JBoss Web', None),
+                 Finding('IIS', None),
+                 Finding('Neos Flow', None)])
+
+        # consecutive findings of an excluded app are all removed
+        findings = [Finding('Apache Tomcat', None),
+                    Finding('Apache Tomcat', '7'),
+                    Finding('JBoss Web', None)]
+        self.detector.remove_exclusions(findings)
+        assert findings == [Finding('JBoss Web', None)]
+
+    def test_implies_excludes_legacy(self):
+        # precomputed implies and excludes give the same apps as following implies until there are no new ones,
+        # and then removing all excluded apps (apps not defined in clues aren't added at all)
+        def implied_by(found):
+            return set(implied for app in found for implied in self.apps.get(app, {}).get('implies', [])) - set(found)
+
+        def legacy(apps):
+            found = list(apps)
+            new = implied_by(found)
+            while new:
+                found += sorted(new)
+                new = implied_by(found)
+            excluded = set(excluded for app in found for excluded in self.apps.get(app, {}).get('excludes', []))
+            return set(app for app in found if app in self.apps and app not in excluded)
+
+        def current(apps):
+            findings = [Finding(app, None) for app in apps]
+            self.detector.follow_implies(findings)
+            self.detector.remove_exclusions(findings)
+            assert len(findings) == len(set(f.app for f in findings))
+            return set(f.app for f in findings)
+
+        rng = random.Random(0)
+        corpus = [f.app for f in self.detector.findings(cern_ch_test_data['geturl'], cern_ch_test_data['headers'],
+                                                           cern_ch_test_data['content'])]
+        samples = ([[app] for app in sorted(self.apps)] + [corpus] +
+                   [rng.sample(sorted(self.apps), 10) for _ in range(300)])
+        for apps in samples:
+            assert current(apps) == legacy(apps), apps
+
+    def test_materialize(self):
         findings = [
-            {'app': 'Django CMS', 'ver': None},
-            {'app': 'Django', 'ver': None},
-            {'app': 'Python', 'ver': '2.7'},
-            {'app': 'Dynamicweb', 'ver': 'beta'}]
-        original = copy.deepcopy(findings)
-        original[0]["type"] = "CMS"
-        original[1]["type"] = "Web Application Frameworks"
-        original[2]["type"] = "Programming Languages"
-        original[3]["type"] = "CMS,Ecommerce,Analytics"
-
-        self.detector.add_categories(findings)
-        assert original == findings
+            Finding('Django CMS', None, 'html'),
+            Finding('Django', None, 'implies'),
+            Finding('Python', '2.7', 'headers(Server)'),
+            Finding('Dynamicweb', 'beta', 'meta(generator)')]
+
+        assert self.detector.materialize(findings) == [
+            {'app': 'Django CMS', 'ver': None, 'type': "CMS"},
+            {'app': 'Django', 'ver': None, 'type': "Web Application Frameworks"},
+            {'app': 'Python', 'ver': '2.7', 'type': "Programming Languages"},
+            {'app': 'Dynamicweb', 'ver': 'beta', 'type': "CMS,Ecommerce,Analytics"}]
 
     def test_url_match(self):
         assert self.detector.url_match(url='', regexp=None, default='test') == 'test'
@@ -232,14 +362,117 @@ class TestDetector(unittest.TestCase):
         with mock.patch('wad.detection.Detector.detect') as mockObj:
             mockObj.side_effect = [{'test1': 1}, {'test2': 2}]
             assert self.detector.detect_multiple(urls_list) == {'test1': 1, 'test2': 2}
-            assert (('example.com', None, None, TIMEOUT),) in mockObj.call_args_list
-            assert (('http://cern.ch', None, None, TIMEOUT),) in mockObj.call_args_list
+            assert mock.call('example.com', None, None, TIMEOUT, raise_errors=True) in mockObj.call_args_list
+            assert mock.call('http://cern.ch', None, None, TIMEOUT, raise_errors=True) in mockObj.call_args_list
+
+    def test_detect_multiple_concurrent(self):
+        urls_list = ["http://%d.cern.ch" % i for i in range(20)] + [None, "", "http://0.cern.ch"]
+
+        def fake_detect(url, limit, exclude, timeout, raise_errors):
+            if url == "http://13.cern.ch":
+                raise ValueError("broken site")
+            return {url: [{'app': 'Apache', 'ver': None}]}
+
+        with mock.patch('wad.detection.Detector.detect') as mockObj:
+            mockObj.side_effect = fake_detect
+            results = self.detector.detect_multiple(urls_list, workers=4)
+        assert mockObj.call_count == 20
+        assert sorted(results) == sorted(url for url in set(urls_list) - set([None, "", "http://13.cern.ch"]))
+
+    def test_match_page(self):
+        detection.init_matching_process(None, None)
+        content = cern_ch_test_data['content']
+        if six.PY3:
+            content = content.encode('latin-1')
+        assert (detection.match_page(cern_ch_test_data['geturl'], list(cern_ch_test_data['headers'].items()),
+                                     content) ==
+                self.detector.findings(cern_ch_test_data['geturl'], cern_ch_test_data['headers'],
+                                       cern_ch_test_data['content']))
+
+    def test_detect_multiple_processes(self):
+        with StubServer(body=b'<html><meta name="generator" content="Drupal 7"><script src="jquery.js">') as server:
+            urls = [server.url + 'page%d.html' % i for i in range(6)]
+            serial = self.detector.detect_multiple(urls)
+            pipelined = self.detector.detect_multiple(urls, workers=3, processes=2)
+        assert self.detector.matching_pool is None
+        assert pipelined == serial
+        assert set(f['app'] for f in serial[urls[0]]) == set(['Apache', 'Ubuntu', 'Drupal', 'PHP', 'jQuery'])
+
+        detector = CustomDetector(match_timeout=5, memo_size=0)
+        with StubServer() as server:
+            urls = [server.url + 'page%d.html' % i for i in range(2)]
+            serial = detector.detect_multiple(urls)
+            pipelined = detector.detect_multiple(urls, processes=1)
+        assert pipelined == serial
+        assert [f['ver'] for f in serial[urls[0]] if f['app'] == 'Drupal'] == ['5']
 
     def test_normalize_url(self):
         assert self.detector.normalize_url('http://abc.pl') == 'http://abc.pl/'
         assert self.detector.normalize_url('http://abc.pl/') == 'http://abc.pl/'
         assert self.detector.normalize_url('http://abc.pl/def') == 'http://abc.pl/def'
 
+    def test_get_content(self):
+        page = mock.MagicMock()
+        page.read.side_effect = six.BytesIO(b'x' * 200000).read
+        assert self.detector.get_content(page, 'http://abc.xyz/') == b'x' * 200000
+        assert self.detector.metadata['http://abc.xyz/'] == {'size': 200000, 'truncated': False}
+        assert not page.close.called
+
+        detector = Detector(max_content_size=100000)
+        page.read.side_effect = six.BytesIO(b'x' * 200000).read
+        assert detector.get_content(page, 'http://abc.xyz/') == b'x' * 100000
+        assert detector.metadata['http://abc.xyz/'] == {'size': 100000, 'truncated': True}
+        assert page.close.called
+
+        # content ending exactly at the limit is not truncated
+        page.read.side_effect = six.BytesIO(b'x' * 100000).read
+        assert detector.get_content(page, 'http://abc.xyz/') == b'x' * 100000
+        assert detector.metadata['http://abc.xyz/'] == {'size': 100000, 'truncated': False}
+
+        # out of time: whatever was read so far is used
+        detector = Detector(max_read_time=0)
+        page.read.side_effect = six.BytesIO(b'x' * 200000).read
+        with mock.patch('wad.detection.time.time', side_effect=[0, 0.5]):
+            assert detector.get_content(page, 'http://abc.xyz/') == b'x' * CHUNK_SIZE
+        assert detector.metadata['http://abc.xyz/'] == {'size': CHUNK_SIZE, 'truncated': True}
+
+    def test_memo(self):
+        page = mock.MagicMock()
+        page.info.return_value = cern_ch_test_data['headers']
+        content = cern_ch_test_data['content'].encode('utf-8')
+
+        first = self.detector.analyze(page, 'http://abc.xyz/', content)
+        with mock.patch.object(Detector, 'findings') as findings:
+            second = self.detector.analyze(page, 'http://def.xyz/', content)
+            assert not findings.called
+        assert second == first
+        assert (self.detector.memo.hits, self.detector.memo.misses) == (1, 1)
+
+        # returned findings are copies
+        second.pop()
+        assert self.detector.analyze(page, 'http://def.xyz/', content) == first
+
+        # anything findings depend on changes the key
+        key = self.detector.memo_key('http://abc.xyz/', cern_ch_test_data['headers'], content)
+        assert key == self.detector.memo_key('http://def.xyz/', cern_ch_test_data['headers'], content)
+        assert key != self.detector.memo_key('http://abc.xyz/', cern_ch_test_data['headers'], content + b' ')
+        assert key != self.detector.memo_key('http://abc.xyz/script.php', cern_ch_test_data['headers'], content)
+        assert key != self.detector.memo_key('http://abc.xyz/', {'Server': 'nginx'}, content)
+        # ... except headers which no clues refer to
+        headers = dict(cern_ch_test_data['headers'], Date='Thu, 01 Jan 2015 00:00:00 GMT')
+        assert key == self.detector.memo_key('http://abc.xyz/', headers, content)
+        # ... and parts of headers and cookies which don't change clue matches (e.g. session IDs), while cookies
+        # are taken from the same Set-Cookie header as by check_cookies (the first one)
+        def message(*cookies):
+            headers = Message()
+            for cookie in cookies:
+                headers['Set-Cookie'] = cookie
+            return headers
+        key = self.detector.memo_key('http://abc.xyz/', message('sid=1; AWSELB=a', 'x=1'), content)
+        assert key == self.detector.memo_key('http://abc.xyz/', message('sid=2; AWSELB=b', 'x=2'), content)
+        assert key != self.detector.memo_key('http://abc.xyz/', message('sid=1', 'AWSELB=a'), content)
+        assert key != self.detector.memo_key('http://abc.xyz/', message('sid=1; AWSELB=a', 'BITRIX_SM=1'), content)
+
     def test_regression_meta_attributes_order(self):
         # This bug was caused by hardcoded attributes order in re_meta pattern.
         # Example app that was affected was GitLab CI.
@@ -249,7 +482,7 @@ class TestDetector(unittest.TestCase):
         results1 = self.detector.check_meta(content1)
         results2 = self.detector.check_meta(content2)
 
-        expected = [{'app': 'GitLab CI', 'ver': None}]
+        expected = [Finding('GitLab CI', None)]
 
         assert results1 == results2 == expected
 
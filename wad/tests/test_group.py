@@ -1,8 +1,10 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import copy
 import json
 from wad.group import is_sub_url, group, get_dir
 from wad.tests.data.data_test_wad import vinput, voutput
+from wad.tests.data.synthetic import synthetic_results
 
 
 def test_get_dir():
@@ -45,6 +47,8 @@ def test_is_sub_url():
                           'http://m.example.com/foo/')
     assert not is_sub_url('http://m.example.com/foo/bar/f',
                           'http://m.example.com/foo/bar/f.txt')
+    assert not is_sub_url('http://m.example.com/foo',
+                          'http://m.example.com/foobar/')
     assert not is_sub_url('https://m.example.com/foo/',
                           'http://m.example.com/foo/bar/x.y/z')
     assert not is_sub_url('http://example.com/foo/',
@@ -53,3 +57,47 @@ def test_is_sub_url():
                           'http://example.com/foo/bar/x.y/z')
     assert not is_sub_url('http://x.example.com/foo/',
                           'http://m.example.com/foo/bar/x.y/z')
+
+
+def group_pairwise(results):
+    # the original algorithm, comparing each pair of URLs
+    for url in results:
+        for url2 in results:
+            if is_sub_url(url, url2):
+                for finding in results[url]:
+                    if finding in results[url2]:
+                        results[url2].remove(finding)
+    return dict((url, findings) for url, findings in results.items() if findings)
+
+
+def test_group_removes_empty_urls():
+    results = {
+        'http://example.com/': [{'app': 'Apache', 'ver': None, 'type': 'web-servers'}],
+        'http://example.com/a/': [{'app': 'Apache', 'ver': None, 'type': 'web-servers'}],
+        'http://example.com/a/b.html': [{'app': 'Apache', 'ver': None, 'type': 'web-servers'}],
+        'http://example.com/ab/': [{'app': 'PHP', 'ver': '5.4', 'type': 'programming-languages'}],
+    }
+    assert group(results) == {
+        'http://example.com/': [{'app': 'Apache', 'ver': None, 'type': 'web-servers'}],
+        'http://example.com/ab/': [{'app': 'PHP', 'ver': '5.4', 'type': 'programming-languages'}],
+    }
+
+
+def test_group_files_in_same_dir():
+    results = {
+        'http://example.com/a/x.html': [{'app': 'PHP', 'ver': None, 'type': 'x'}],
+        'http://example.com/a/y.html': [{'app': 'PHP', 'ver': None, 'type': 'x'},
+                                        {'app': 'jQuery', 'ver': None, 'type': 'y'}],
+        'http://example.com/a': [{'app': 'jQuery', 'ver': None, 'type': 'y'}],
+    }
+    assert group(results) == {
+        'http://example.com/a/x.html': [{'app': 'PHP', 'ver': None, 'type': 'x'}],
+        'http://example.com/a': [{'app': 'jQuery', 'ver': None, 'type': 'y'}],
+    }
+
+
+def test_group_as_pairwise():
+    for seed in range(5):
+        results = synthetic_results(200, seed)
+        assert group(copy.deepcopy(results)) == group_pairwise(copy.deepcopy(results))
+
@@ -0,0 +1,76 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import re
+import time
+
+import pytest
+
+from wad.detection import Detector
+from wad.finding import Finding
+from wad.guard import GuardedPool, MatchTimeout, RegexGuard, regex_guard
+
+CATASTROPHIC = re.compile('^(a+)+$')
+# short, yet taking forever without a time limit
+CATASTROPHIC_TEXT = 'a' * 64 + 'b'
+
+
+def test_guard():
+    guard = RegexGuard()
+    try:
+        regexp = re.compile('v([0-9.]+)')
+        match = guard.search(regexp, 'abc v1.2.3 def')
+        assert (match.group(0), match.group(1)) == ('v1.2.3', '1.2.3')
+        assert guard.search(regexp, 'abc') is None
+        assert guard.pool is not None
+
+        padding = ' ' * 10000
+        match = guard.search(regexp, padding + 'abc v1.2.3 def')
+        assert (match.group(0), match.start()) == ('v1.2.3', 10004)
+
+        start = time.time()
+        with pytest.raises(MatchTimeout):
+            guard.search(CATASTROPHIC, CATASTROPHIC_TEXT, timeout=0.5)
+        assert time.time() - start < 5
+
+        # the guard process is started again
+        assert guard.search(regexp, padding + 'v2').group(1) == '2'
+    finally:
+        guard.close()
+
+
+def test_detector_skips_timed_out_clue():
+    detector = Detector(match_timeout=0.5)
+    detector.risky_regexps = set([CATASTROPHIC])
+    clue = {'re': CATASTROPHIC}
+    assert detector.check_clue(clue, '^(a+)+$', CATASTROPHIC_TEXT, [], 'html', 'Test') == []
+    assert detector.check_clue(clue, '^(a+)+$', 'aaa', [], 'html', 'Test') == [Finding('Test', None)]
+
+
+def timed_out_in_pool():
+    try:
+        regex_guard.search(CATASTROPHIC, CATASTROPHIC_TEXT, timeout=0.5)
+    except MatchTimeout:
+        return True
+    finally:
+        regex_guard.close()
+    return False
+
+
+def test_guarded_pool():
+    # processes of the pool have their own guard process
+    pool = GuardedPool(1)
+    try:
+        assert pool.apply_async(timed_out_in_pool).get(10)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def test_detector_skips_timed_out_meta():
+    # ^IMPERIA ([0-9.]{2,})+$ takes exponential time on a short meta tag
+    detector = Detector(match_timeout=0.5)
+    start = time.time()
+    assert detector.check_meta('<meta name="generator" content="IMPERIA %sx">' % ('1' * 60)) == []
+    assert time.time() - start < 5
+    assert (detector.check_meta('<meta name="generator" content="IMPERIA 10.1">') ==
+            [Finding('imperia CMS', '10.1')])
@@ -0,0 +1,89 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import six
+
+import io
+import os
+import shutil
+import tempfile
+
+import mock
+
+from wad.detection import Detector
+from wad.journal import Journal
+from wad.tests.stub_server import StubServer
+
+
+def test_journal():
+    tempdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tempdir, 'journal.jsonl')
+        journal = Journal(filename)
+        assert journal.done == {}
+        journal.record('http://a.example.com', {'http://a.example.com/': [{'app': 'Apache', 'ver': None}]})
+        journal.record('http://b.example.com', {}, error='timed out')
+        journal.close()
+
+        # the scan was interrupted while writing an entry
+        with io.open(filename, 'a', encoding='utf-8') as f:
+            f.write('{"url": "http://c.exa')
+
+        journal = Journal(filename)
+        # failed URLs aren't done, so that they are scanned again
+        assert journal.done == {'http://a.example.com': {'http://a.example.com/': [{'app': 'Apache', 'ver': None}]}}
+        assert journal.errors == {'http://b.example.com': 'timed out'}
+        journal.record('http://b.example.com', {})
+        journal.record('http://c.example.com', {})
+        journal.close()
+
+        journal = Journal(filename)
+        assert set(journal.done) == set(['http://a.example.com', 'http://b.example.com', 'http://c.example.com'])
+        assert journal.errors == {}
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_detect_multiple_resumed():
+    tempdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tempdir, 'journal.jsonl')
+        with StubServer() as server:
+            urls = [server.url + 'a.html', server.url + 'b.html', server.url + 'c.html']
+            journal = Journal(filename)
+            first = Detector().detect_multiple(urls[:2], journal=journal, workers=2)
+            journal.close()
+
+            journal = Journal(filename)
+            results = Detector().detect_multiple(urls, journal=journal)
+            journal.close()
+        # only the URL not in the journal was scanned again
+        assert sorted(path for _, path in server.requests) == ['/a.html', '/b.html', '/c.html']
+        assert set(results) == set(urls)
+        assert results[urls[0]] == first[urls[0]]
+        assert set(Journal(filename).done) == set(urls)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_detect_multiple_failed():
+    # URLs which can't be fetched (e.g. the network is down) are recorded as failed, and scanned again on resume
+    tempdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tempdir, 'journal.jsonl')
+        with StubServer() as server:
+            url = server.url + 'a.html'
+            journal = Journal(filename)
+            with mock.patch('wad.detection.tools.urlopen',
+                            side_effect=six.moves.urllib.error.URLError('network is down')):
+                assert Detector().detect_multiple([url], journal=journal) == {}
+            journal.close()
+
+            journal = Journal(filename)
+            assert journal.done == {}
+            assert journal.errors == {url: 'Error opening %s' % url}
+            results = Detector().detect_multiple([url], journal=journal)
+            journal.close()
+        assert [path for _, path in server.requests] == ['/a.html']
+        assert set(results) == set([url])
+        assert set(Journal(filename).done) == set([url])
+    finally:
+        shutil.rmtree(tempdir)
@@ -1,8 +1,10 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 import six
 
+import json
+import mock
 import unittest
-from wad.output import JSONOutput, ConsolePrettyOutput, CSVOutput, HumanReadableOutput
+from wad.output import JSONOutput, JSONLinesOutput, ConsolePrettyOutput, CSVOutput, HumanReadableOutput
 
 
 class TestOutputs(unittest.TestCase):
@@ -47,3 +49,33 @@ class TestOutputs(unittest.TestCase):
         output = CSVOutput().retrieve(results=self.input)
         results = [line.strip() for line in six.StringIO(output).readlines()]
         assert set(expected_lines) == set(results)
+
+    def stream(self, output_format):
+        results = [{url: findings} for url, findings in six.iteritems(self.input)] + [{}]
+        f = six.StringIO()
+        output_format.stream(iter(results), f)
+        return f.getvalue()
+
+    def test_json_stream(self):
+        assert json.loads(self.stream(JSONOutput())) == self.input
+        assert json.loads(JSONOutput().header() + JSONOutput().footer()) == {}
+
+    def test_json_lines(self):
+        for output in [self.stream(JSONLinesOutput()), JSONLinesOutput().retrieve(self.input)]:
+            lines = output.splitlines()
+            assert len(lines) == 2
+            assert dict(item for line in lines for item in six.iteritems(json.loads(line))) == self.input
+
+    def test_csv_stream(self):
+        output = self.stream(CSVOutput())
+        assert set(output.splitlines()) == set(CSVOutput().retrieve(results=self.input).splitlines())
+        assert output.splitlines()[0] == 'URL,Finding,Version,Type'
+
+    def test_human_readable_stream(self):
+        assert (sorted(self.stream(HumanReadableOutput()).splitlines()) ==
+                sorted(HumanReadableOutput().retrieve(self.input).splitlines()))
+
+    def test_stream_flushes(self):
+        f = mock.Mock()
+        JSONLinesOutput().stream(iter([{'http://a.com/': []}, {'http://b.com/': []}]), f)
+        assert [c[0] for c in f.method_calls] == ['write', 'write', 'flush', 'write', 'flush', 'write', 'flush']
@@ -0,0 +1,76 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import re
+
+from wad.detection import Detector
+from wad.page import HtmlPage
+from wad.tests.data.data_test_wad import cern_ch_test_data
+from wad.tests.data.synthetic import synthetic_pages
+
+
+def test_html_page():
+    page = HtmlPage('<html><META Content="Drupal 7 (http://drupal.org)" NAME="Generator"/>'
+                    "<meta name=description content='It\"s > 3'>"
+                    '<meta name=viewport content=width=device-width>'
+                    '<meta property="og:site_name" content="CERN">'
+                    '<metadata name="x" content="y">'
+                    '<script data-src="lazy.js" src="jquery.min.js" src="other.js"></script>'
+                    '<script type="text/javascript">document.write(\'<script src="/js/mootools.js">\');</script>'
+                    '<SCRIPT async src=/js/app.js>')
+    assert page.meta == [('Generator', 'Drupal 7 (http://drupal.org)'), ('description', 'It"s > 3'),
+                         ('viewport', 'width=device-width')]
+    assert page.script_srcs == ['jquery.min.js', '/js/mootools.js', '/js/app.js']
+    assert page.tags[3] == ('meta', {'property': 'og:site_name', 'content': 'CERN'})
+    assert page.tags[-1] == ('script', {'async': '', 'src': '/js/app.js'})
+
+
+def test_html_page_malformed():
+    # malformed attributes are skipped, and meta tags with an empty name or content aren't used (as before)
+    page = HtmlPage('<meta "junk" name="generator" content="Foswiki">'
+                    '<meta = \'x\' name=keywords content=wiki>'
+                    '<meta name="confluence-request-time" content="">'
+                    '<meta name="" content="Drupal">'
+                    '<script "junk" src="/js/app.js">')
+    assert page.meta == [('generator', 'Foswiki'), ('keywords', 'wiki')]
+    assert page.tags[0] == ('meta', {'"junk"': '', 'name': 'generator', 'content': 'Foswiki'})
+    assert page.tags[2] == ('meta', {'name': 'confluence-request-time', 'content': ''})
+    assert page.script_srcs == ['/js/app.js']
+    assert Detector().check_meta(page) == []
+
+
+def test_html_page_raw():
+    # raw content gives the same model as the decoded one
+    content = ('<meta name="Gen\xe9rator" content="caf\xe9 \xa0 1.0"><script SRC=\'/\xe9t\xe9.js\'>' +
+               cern_ch_test_data['content'])
+    page, raw_page = HtmlPage(content), HtmlPage(content.encode('latin-1'))
+    assert raw_page.tags == page.tags
+    assert raw_page.meta == page.meta
+    assert raw_page.script_srcs == page.script_srcs
+    assert page.meta[0] == ('Gen\xe9rator', 'caf\xe9 \xa0 1.0')
+
+
+def test_html_page_legacy():
+    # the same meta tags and scripts as found by the regexps used before, on pages without unusual markup
+    re_meta = re.compile(r'<meta[^>]+>', re.IGNORECASE)
+    re_content = re.compile(r'content\s*=\s*[\'"]([^\'"]+)[\'"]', re.IGNORECASE)
+    re_name = re.compile(r'name\s*=\s*[\'"]([^\'"]+)[\'"]', re.IGNORECASE)
+    re_script = re.compile(r'<script[^>]+src\s*=\s*["\']([^"\']*)', re.IGNORECASE)
+
+    for content in [cern_ch_test_data['content']] + [page[3] for page in synthetic_pages([100000])]:
+        meta = []
+        for tag in re_meta.finditer(content):
+            names, contents = re_name.findall(tag.group(0)), re_content.findall(tag.group(0))
+            if names and contents:
+                meta.append((names[0], contents[0]))
+        page = HtmlPage(content)
+        assert page.meta == meta
+        assert page.script_srcs == re_script.findall(content)
+
+
+def test_checks_with_page():
+    detector = Detector()
+    content = cern_ch_test_data['content']
+    page = HtmlPage(content)
+    for check in [detector.check_meta, detector.check_script, detector.check_html]:
+        assert check(page) == check(content)
+        assert check(page)
@@ -0,0 +1,95 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import six
+
+import base64
+import os
+
+import mock
+import pytest
+
+from wad import tools
+from wad.detection import Detector
+from wad.pool import ConnectionPool
+from wad.tests.stub_server import StubServer
+
+
+def test_keep_alive():
+    pool = ConnectionPool()
+    with StubServer() as server:
+        for i in range(5):
+            page = tools.urlopen(server.url + 'page%d.html' % i, timeout=3, pool=pool)
+            assert page.read() == server.body
+            assert page.getcode() == 200
+            assert page.info()['Server'] == 'Apache/2.4.7 (Ubuntu)'
+        pool.close()
+    assert len(server.requests) == 5
+    assert server.connections == 1
+
+
+def test_redirect():
+    pool = ConnectionPool()
+    with StubServer() as server:
+        page = pool.urlopen(server.url + 'redirect', timeout=3)
+        assert page.geturl() == server.url + 'index.html'
+        assert page.read() == server.body
+        pool.close()
+    assert [path for _, path in server.requests] == ['/redirect', '/index.html']
+    assert server.connections == 1
+
+
+def test_http_error():
+    pool = ConnectionPool()
+    with StubServer() as server:
+        with pytest.raises(six.moves.urllib.error.HTTPError) as e:
+            pool.urlopen(server.url + 'missing', timeout=3)
+        assert e.value.code == 404
+        assert e.value.read() == b'not found'
+
+        # partially read response closes the connection, instead of giving it back to the pool
+        page = pool.urlopen(server.url, timeout=3)
+        page.read(5)
+        page.close()
+        assert page.read() == b''
+        assert pool.urlopen(server.url, timeout=3).read() == server.body
+        pool.close()
+    assert server.connections == 2
+
+
+def test_connection_refused():
+    with StubServer() as server:
+        url = server.url
+    with pytest.raises(six.moves.urllib.error.URLError):
+        ConnectionPool().urlopen(url, timeout=3)
+
+
+def test_detector_keep_alive():
+    detector = Detector(keep_alive=True)
+    with StubServer() as server:
+        results = detector.detect_multiple([server.url + 'a.html', server.url + 'b.html'])
+        detector.pool.close()
+    assert server.connections == 1
+    assert set(f['app'] for f in results[server.url + 'a.html']) >= set(['Apache', 'jQuery', 'Ubuntu'])
+
+
+def test_proxy():
+    with StubServer() as proxy:
+        environ = {'http_proxy': proxy.url.replace('//', '//user:p%40ss@'), 'https_proxy': proxy.url,
+                   'no_proxy': 'direct.example.com'}
+        with mock.patch.dict(os.environ, environ):
+            pool = ConnectionPool()
+            page = pool.urlopen('http://www.example.com/index.html', timeout=3)
+            assert page.read() == proxy.body
+            pool.close()
+
+            port = proxy.server_address[1]
+            credentials = base64.b64encode(b'user:p@ss').decode('ascii')
+            assert pool.proxy('http', 'www.example.com') == ('127.0.0.1', port, 'Basic ' + credentials)
+            assert pool.proxy('http', 'direct.example.com') is None
+            assert pool.proxy('ftp', 'www.example.com') is None
+
+            # HTTPS is tunnelled through the proxy
+            key = ('https', 'www.example.com', 443, pool.proxy('https', 'www.example.com'))
+            conn, _ = pool.acquire(key, 3)
+            assert (conn.host, conn.port) == ('127.0.0.1', port)
+            assert (conn._tunnel_host, conn._tunnel_port) == ('www.example.com', 443)
+    assert [path for _, path in proxy.requests] == ['http://www.example.com/index.html']
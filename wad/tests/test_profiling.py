@@ -0,0 +1,37 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from wad.detection import Detector
+from wad.profiling import ClueProfile
+from wad.tests.data.data_test_wad import cern_ch_test_data
+
+
+def test_clue_profile():
+    profile = ClueProfile()
+    profile.record('Drupal', 'headers(X-Generator)', 'Drupal', 0.002, True)
+    profile.record('Drupal', 'headers(X-Generator)', 'Drupal', 0.002, False)
+    profile.record('Drupal', 'html', '<div id="drupal', 0.001, False)
+    profile.record('jQuery', 'script', 'jquery', 0.003, True)
+    assert profile.stats[('Drupal', 'headers(X-Generator)', 'Drupal')] == [2, 0.004, 1]
+    assert profile.by_clue_type()[('Drupal', 'headers')] == [2, 0.004, 1]
+
+    report = profile.report(top=2).splitlines()
+    assert report[1].split() == ['4.00', 'ms', '2', 'calls', '50.0%', 'hits', 'Drupal', 'headers(X-Generator):',
+                                 'Drupal']
+    assert 'jQuery script: jquery' in report[2]
+    assert len(report) == 6
+
+
+def test_detector_profile():
+    assert Detector().profile is None
+    assert 'check_clue' not in vars(Detector())
+
+    detector = Detector(profile=True)
+    findings = detector.findings(cern_ch_test_data['geturl'], cern_ch_test_data['headers'],
+                                 cern_ch_test_data['content'])
+    # the same findings as without profiling
+    assert findings == Detector().findings(cern_ch_test_data['geturl'], cern_ch_test_data['headers'],
+                                           cern_ch_test_data['content'])
+    hits = set(app for (app, _, _), (_, _, hit) in detector.profile.stats.items() if hit)
+    assert hits >= set(['Drupal', 'Apache', 'jQuery'])
+    assert 'Most expensive clue patterns' in detector.profile.report()
+    assert vars(detector)['check_clue'] == detector.profiled_check_clue
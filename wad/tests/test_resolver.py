@@ -0,0 +1,64 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import mock
+import socket
+import time
+
+import pytest
+
+from wad.detection import Detector
+from wad.resolver import Resolver
+from wad.tests.stub_server import StubServer
+
+LOCALHOST = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 0))]
+
+
+def fake_getaddrinfo(host, *args):
+    if host == 'localhost':
+        return LOCALHOST
+    if host == 'dns-failure.example.com':
+        raise socket.gaierror(socket.EAI_AGAIN, 'Temporary failure in name resolution')
+    raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+
+
+@mock.patch('socket.getaddrinfo', side_effect=fake_getaddrinfo)
+def test_resolve(getaddrinfo):
+    resolver = Resolver()
+    assert resolver.resolve_all(['localhost', 'missing.example.com', 'dns-failure.example.com', None]) == \
+        set(['missing.example.com'])
+    assert getaddrinfo.call_count == 3
+
+    assert resolver.resolve('localhost', 80) == [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 80))]
+    with pytest.raises(socket.gaierror):
+        resolver.resolve('missing.example.com', 80)
+    # hosts which don't exist are cached too, but not temporary failures
+    assert getaddrinfo.call_count == 3
+    with pytest.raises(socket.gaierror):
+        resolver.resolve('dns-failure.example.com', 80)
+    assert getaddrinfo.call_count == 4
+
+    with mock.patch('wad.resolver.time.time', return_value=time.time() + 3600):
+        resolver.resolve('localhost', 80)
+    assert getaddrinfo.call_count == 5
+
+
+def test_detector_resolver():
+    with StubServer() as server:
+        url = server.url.replace('127.0.0.1', 'localhost')
+        with mock.patch('socket.getaddrinfo', side_effect=fake_getaddrinfo) as getaddrinfo:
+            detector = Detector(resolver=Resolver())
+            journal = mock.Mock(done={})
+            start = time.time()
+            with mock.patch.object(detector, 'fetch', wraps=detector.fetch) as fetch:
+                results = detector.detect_multiple([url + 'a.html', url + 'b.html', 'http://missing.example.com/'],
+                                                   workers=3, journal=journal)
+            assert time.time() - start < 1
+        detector.pool.close()
+    assert getaddrinfo.call_count == 2
+    # URLs of hosts which don't exist aren't fetched at all, and are recorded as failed
+    assert sorted(call[0][0] for call in fetch.call_args_list) == [url + 'a.html', url + 'b.html']
+    journal.record.assert_any_call('http://missing.example.com/', {}, error="host doesn't exist")
+    assert set(results) == set([url + 'a.html', url + 'b.html'])
+    assert 'jQuery' in set(f['app'] for f in results[url + 'a.html'])
+    # without keep-alive, connections aren't reused
+    assert server.connections == 2
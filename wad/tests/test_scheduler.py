@@ -0,0 +1,92 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+import time
+
+import mock
+
+from wad.detection import Detector
+from wad.scheduler import HostScheduler
+from wad.tests.stub_server import StubServer
+
+
+class FakeClock(object):
+    # time passes only when sleeping (in steps exact in binary floating point, as used below)
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_interleaving():
+    urls = ['http://a.com/%d' % i for i in range(3)] + ['http://b.com/%d' % i for i in range(2)] + ['http://c.com/']
+    scheduler = HostScheduler(urls, max_per_host=10)
+    acquired = [scheduler.acquire() for _ in urls]
+    assert acquired == ['http://a.com/0', 'http://b.com/0', 'http://c.com/', 'http://a.com/1', 'http://b.com/1',
+                        'http://a.com/2']
+    assert scheduler.acquire() is None
+
+
+def test_max_per_host():
+    scheduler = HostScheduler(['http://a.com/1', 'http://a.com/2', 'http://b.com/1'], max_per_host=1)
+    assert scheduler.acquire() == 'http://a.com/1'
+    assert scheduler.acquire() == 'http://b.com/1'
+
+    # a.com is busy, so the next acquire() waits for release()
+    threading.Timer(0.1, scheduler.release, ['http://a.com/1']).start()
+    start = time.time()
+    assert scheduler.acquire() == 'http://a.com/2'
+    assert time.time() - start >= 0.05
+
+
+def test_min_delay():
+    clock = FakeClock()
+    scheduler = HostScheduler(['http://a.com/1', 'http://a.com/2', 'http://b.com/1', 'http://a.com/3'],
+                              min_delay=0.25, clock=clock.time, sleep=clock.sleep)
+    starts = []
+    for _ in range(4):
+        starts.append((scheduler.acquire(), clock.now))
+    assert starts == [('http://a.com/1', 0.0), ('http://b.com/1', 0.0), ('http://a.com/2', 0.25),
+                      ('http://a.com/3', 0.5)]
+    assert scheduler.acquire() is None
+
+
+def test_load():
+    # all URLs of a host are listed together, yet all hosts are scanned at the same time, each with at most
+    # max_per_host of its URLs
+    urls = ['http://host%d.com/%d' % (host, i) for host in range(4) for i in range(20)]
+    scheduler = HostScheduler(urls, max_per_host=2)
+    in_flight = [scheduler.acquire() for _ in range(8)]
+    assert sorted(HostScheduler.host(url) for url in in_flight) == sorted(['host%d.com' % host
+                                                                           for host in range(4)] * 2)
+    acquired = list(in_flight)
+    while in_flight:
+        scheduler.release(in_flight.pop(0))
+        url = scheduler.acquire()
+        if url is not None:
+            in_flight.append(url)
+            acquired.append(url)
+            assert sum(HostScheduler.host(other) == HostScheduler.host(url) for other in in_flight) <= 2
+    assert sorted(acquired) == sorted(urls)
+
+
+def test_detect_multiple_per_host():
+    servers = [StubServer(delay=0.02) for _ in range(2)]
+    for server in servers:
+        server.__enter__()
+    try:
+        urls = [server.url + 'page%d.html' % i for server in servers for i in range(10)]
+        with mock.patch('wad.detection.HostScheduler', wraps=HostScheduler) as scheduler:
+            Detector(collect_metadata=False, memo_size=0).detect_multiple(urls, workers=8, host_concurrency=2,
+                                                                          host_delay=0.01)
+        assert scheduler.call_args[0][1:] == (2, 0.01)
+    finally:
+        for server in servers:
+            server.__exit__()
+    for server in servers:
+        assert len(server.requests) == 10
+        assert server.max_in_flight <= 2
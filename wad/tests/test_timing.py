@@ -0,0 +1,47 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from wad.detection import Detector
+from wad.tests.stub_server import StubServer
+from wad.timing import histogram, percentile, summary, timed
+
+
+def test_timed():
+    timing = {}
+    for _ in range(2):
+        with timed(timing, 'check_html'):
+            pass
+    assert list(timing) == ['check_html']
+    assert timing['check_html'] >= 0
+
+    with timed(None, 'check_html'):
+        pass
+
+
+def test_summary():
+    assert percentile([1, 2, 3, 4], 50) == 3
+    assert percentile([1, 2, 3, 4], 99) == 4
+    assert histogram([0.0005, 0.002, 0.003, 0.5, 20]) == [1, 2, 0, 1, 0, 1]
+
+    lines = summary([{'dns': 0.002, 'total': 0.5}, {'total': 1.5}, {'custom': 0.01}]).splitlines()
+    assert lines[0].split()[:7] == ['phase', 'count', 'mean', 'p50', 'p90', 'p99', 'max']
+    # known phases in the order in which they happen, then unknown ones
+    assert [line.split()[0] for line in lines[1:]] == ['dns', 'total', 'custom']
+    assert lines[2].split() == ['total', '2', '1000.0', '1500.0', '1500.0', '1500.0', '1500.0',
+                                '0', '0', '0', '1', '1', '0']
+
+
+def test_detector_timing():
+    assert Detector().collect_timing is False
+
+    detector = Detector(collect_metadata=False, collect_timing=True)
+    with StubServer() as server:
+        results = detector.detect_multiple([server.url + 'redirect'])
+        detector.pool.close()
+    assert set(f['app'] for f in results[server.url + 'index.html']) >= set(['Apache', 'jQuery'])
+
+    timing = detector.metadata[server.url + 'index.html']['timing']
+    assert set(timing) >= set(['dns', 'connect', 'ttfb', 'fetch', 'body', 'decode', 'matching', 'check_url',
+                               'check_headers', 'check_html', 'post_processing', 'total'])
+    assert timing['fetch'] >= timing['connect'] + timing['ttfb']
+    assert timing['total'] >= timing['fetch'] + timing['body'] + timing['matching']
+    assert 'check_html' in detector.timing_summary()
@@ -0,0 +1,302 @@
+# Benchmarks of the detection engine
+#
+# Usage: python -m wad.tests.tools.benchmark [FILE ...] [--json FILE]
+#
+# Recorded pages are read from given files; by default the test page from wad.tests.data is used. Synthetic pages
+# of various sizes are added to them for measuring the throughput of Detector.findings(). No network is used
+# (scheduling is measured against local stub servers).
+from __future__ import absolute_import, division, print_function, unicode_literals
+import six
+
+import io
+import json
+import platform
+import re
+import shutil
+import tempfile
+import time
+from optparse import OptionParser
+
+from wad import tools
+from wad.clues import Clues, _Clues
+from wad.detection import Detector
+from wad.group import group
+from wad.page import HtmlPage
+from wad.scheduler import CONCURRENCY_PER_HOST
+from wad.tests.data.data_test_wad import cern_ch_test_data
+from wad.tests.data.synthetic import synthetic_pages, synthetic_results
+from wad.tests.stub_server import StubServer
+
+
+def tag_texts(url, content):
+    # texts which check_url, check_html and check_script match against
+    return {
+        'url': [url],
+        'html': [content],
+        'script': HtmlPage(content).script_srcs,
+    }
+
+
+def regex_calls(detector, url, content):
+    """
+    :return: dict of clue type -> (number of clue regexps searched without prefilter, number searched with it)
+    """
+    calls = {}
+    for key, texts in six.iteritems(tag_texts(url, content)):
+        table = detector.tables[key]
+        calls[key] = (len(table.entries) * len(texts), sum(len(table.candidates(text)) for text in texts))
+    return calls
+
+
+def search_all(detector, key, text):
+    # matching without prefilter: every clue regexp of given type is searched
+    key_re = key + '_re'
+    for app, i, _ in detector.tables[key].entries:
+        detector.apps[app][key_re][i]['re'].search(text)
+
+
+def search_candidates(detector, key, text):
+    key_re = key + '_re'
+    for app, i in detector.tables[key].candidates(text):
+        detector.apps[app][key_re][i]['re'].search(text)
+
+
+def timed(func, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        func()
+    return (time.time() - start) / repeat
+
+
+def prefilter_benchmark(detector, pages, repeat):
+    lines = []
+    for name, url, _, content in pages:
+        lines.append("%s (%d bytes):" % (name, len(content)))
+        for key, texts in sorted(six.iteritems(tag_texts(url, content))):
+            before, after = regex_calls(detector, url, content)[key]
+            time_before = timed(lambda: [search_all(detector, key, text) for text in texts], repeat)
+            time_after = timed(lambda: [search_candidates(detector, key, text) for text in texts], repeat)
+            lines.append("  %-7s regex calls: %6d -> %5d   time: %8.2f ms -> %6.2f ms" %
+                         (key, before, after, time_before * 1000, time_after * 1000))
+    return '\n'.join(lines)
+
+
+def load_time(cache_dir, repeat):
+    # regexps compiled earlier are purged from re's cache, so that they are really compiled again
+    def load():
+        re.purge()
+        _Clues().get_clues(cache_dir=cache_dir)
+    return timed(load, repeat)
+
+
+def startup_times(repeat):
+    """
+    :return: dict of seconds taken by loading clues without and with the cache
+    """
+    cache_dir = tempfile.mkdtemp()
+    try:
+        cold = load_time(None, repeat)
+        _Clues().get_clues(cache_dir=cache_dir)
+        cached = load_time(cache_dir, repeat)
+    finally:
+        shutil.rmtree(cache_dir)
+    return {'cold': cold, 'cached': cached}
+
+
+def startup_benchmark(repeat):
+    return startup_report(startup_times(repeat))
+
+
+def startup_report(times):
+    return "Clues loading: %.1f ms cold, %.1f ms from cache" % (times['cold'] * 1000, times['cached'] * 1000)
+
+
+CLUE_TYPES = ['url', 'headers', 'cookies', 'meta', 'script', 'html']
+
+
+def clue_checks(detector, url, headers, content):
+    # the same checks as in Detector.findings(), by clue type (parsing the page isn't included in any)
+    page = HtmlPage(content)
+    return {
+        'url': lambda: detector.check_url(url),
+        'headers': lambda: detector.check_headers(headers),
+        'cookies': lambda: detector.check_cookies(headers),
+        'meta': lambda: detector.check_meta(page),
+        'script': lambda: detector.check_script(page),
+        'html': lambda: detector.check_html(page),
+    }
+
+
+def memory_peak(func):
+    """
+    :return: peak of memory allocated while running func, in bytes (None if it can't be measured, i.e. on Python 2)
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def findings_times(detector, pages, repeat):
+    """
+    :return: dict with throughput of Detector.findings() over all pages, average time per page of each clue type
+             (and of the rest, i.e. implies, exclusions etc.), and peak memory usage
+    """
+    def run_all():
+        for _, url, headers, content in pages:
+            detector.findings(url, headers, content)
+
+    total = timed(run_all, repeat)
+    clue_types = dict((key, 0.0) for key in CLUE_TYPES)
+    for _, url, headers, content in pages:
+        for key, check in six.iteritems(clue_checks(detector, url, headers, content)):
+            clue_types[key] += timed(check, repeat)
+    clue_types['other'] = max(0.0, total - sum(clue_types.values()))
+
+    return {
+        'pages': len(pages),
+        'bytes': sum(len(content) for _, _, _, content in pages),
+        'pages_per_sec': len(pages) / total,
+        'bytes_per_sec': sum(len(content) for _, _, _, content in pages) / total,
+        'clue_types': dict((key, spent / len(pages)) for key, spent in six.iteritems(clue_types)),
+        'memory_peak': memory_peak(run_all),
+    }
+
+
+def findings_benchmark(detector, pages, repeat):
+    return findings_report(findings_times(detector, pages, repeat))
+
+
+def findings_report(times):
+    lines = ["Findings of %d pages (%d bytes): %.1f pages/s, %.1f MB/s, memory peak %s" %
+             (times['pages'], times['bytes'], times['pages_per_sec'], times['bytes_per_sec'] / 1024 / 1024,
+              "%.1f MB" % (times['memory_peak'] / 1024 / 1024) if times['memory_peak'] is not None else "unknown")]
+    for key in CLUE_TYPES + ['other']:
+        lines.append("  %-7s %8.2f ms per page" % (key, times['clue_types'][key] * 1000))
+    return '\n'.join(lines)
+
+
+def byte_matching_benchmark(pages, repeat):
+    """
+    Compares decoding pages and finding clues in them, with finding clues in raw content (Detector's match_bytes)
+    """
+    if not six.PY3:
+        return "Matching on raw content: Python 3 only"
+    text_detector, bytes_detector = Detector(), Detector(match_bytes=True)
+    lines = ["Matching on raw content (decoded content -> raw content):"]
+    for name, url, headers, content in pages:
+        raw = content.encode('latin-1')
+        modes = [lambda: text_detector.findings(url, headers, raw.decode('latin-1')),
+                 lambda: bytes_detector.findings(url, headers, raw)]
+        times = [timed(mode, repeat) * 1000 for mode in modes]
+        peaks = [memory_peak(mode) / 1024.0 for mode in modes]
+        lines.append("  %-24s %8.2f ms -> %8.2f ms   memory peak %8.1f KB -> %8.1f KB" %
+                     tuple([name] + times + peaks))
+    return '\n'.join(lines)
+
+
+def grouping_benchmark(counts, repeat):
+    lines = []
+    for count in counts:
+        results = synthetic_results(count)
+        # group() modifies results, so each run gets a fresh copy (not included in the time)
+        runs = []
+        for _ in range(repeat):
+            copy = dict((url, list(findings)) for url, findings in six.iteritems(results))
+            start = time.time()
+            group(copy)
+            runs.append(time.time() - start)
+        lines.append("Grouping %d URLs: %.1f ms" % (count, sum(runs) / repeat * 1000))
+    return '\n'.join(lines)
+
+
+def scheduling_benchmark(hosts, urls_per_host, workers, host_concurrency=CONCURRENCY_PER_HOST, host_delay=0,
+                         server_delay=0.01):
+    """
+    Scans local stub servers (each one being a separate host), with all URLs of a host listed together
+    :return: (report, list of servers)
+    """
+    servers = [StubServer(delay=server_delay) for _ in range(hosts)]
+    for server in servers:
+        server.__enter__()
+    try:
+        urls = [server.url + 'page%d.html' % i for server in servers for i in range(urls_per_host)]
+        start = time.time()
+        Detector(collect_metadata=False, memo_size=0).detect_multiple(
+            urls, workers=workers, host_concurrency=host_concurrency, host_delay=host_delay)
+        elapsed = time.time() - start
+    finally:
+        for server in servers:
+            server.__exit__()
+
+    spacings = [b[0] - a[0] for server in servers for a, b in zip(server.requests, server.requests[1:])]
+    report = ("Scanning %d hosts x %d URLs with %d workers: %.1f pages/s, "
+              "at most %d concurrent requests per host, at least %.1f ms between requests to a host" %
+              (hosts, urls_per_host, workers, len(urls) / elapsed, max(server.max_in_flight for server in servers),
+               min(spacings) * 1000 if spacings else 0))
+    return report, servers
+
+
+def read_pages(filenames):
+    """
+    :return: list of recorded pages, as (name, url, headers, content)
+    """
+    if not filenames:
+        return [('test page', cern_ch_test_data['geturl'], cern_ch_test_data['headers'], cern_ch_test_data['content'])]
+    pages = []
+    for filename in filenames:
+        with io.open(filename, 'rb') as f:
+            pages.append((filename, 'http://localhost/', {}, f.read().decode('latin-1')))
+    return pages
+
+
+def main():
+    parser = OptionParser(usage="Usage: %prog [FILE ...] [--json FILE]")
+    parser.add_option("-n", "--repeat", action="store", dest="repeat", default=10,
+                      help="number of runs for each measurement (default: 10)")
+    parser.add_option("-j", "--json", dest="json_file", metavar="FILE",
+                      help="also write results of findings and startup benchmarks in JSON to this file, "
+                           "for tracking regressions ('-' for standard output)")
+    tools.add_log_options(parser)
+    options, args = parser.parse_args()
+    tools.use_log_options(options)
+
+    repeat = int(options.repeat)
+    detector = Detector()
+    recorded = read_pages(args)
+    pages = recorded + synthetic_pages()
+
+    findings = findings_times(detector, pages, repeat)
+    startup = startup_times(repeat)
+    if options.json_file:
+        results = {
+            'python': platform.python_version(),
+            'clues': Clues.digest,
+            'repeat': repeat,
+            'pages': [{'name': name, 'size': len(content)} for name, _, _, content in pages],
+            'findings': findings,
+            'startup': startup,
+        }
+        if options.json_file == '-':
+            print(json.dumps(results, indent=4, sort_keys=True))
+            return
+        with open(options.json_file, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    print(findings_report(findings))
+    print(prefilter_benchmark(detector, recorded, repeat))
+    print(byte_matching_benchmark(pages, repeat))
+    print(startup_report(startup))
+    print(grouping_benchmark([10000, 100000], max(1, repeat // 10)))
+    print(scheduling_benchmark(hosts=4, urls_per_host=50, workers=16)[0])
+    print(scheduling_benchmark(hosts=4, urls_per_host=10, workers=16, host_delay=0.05)[0])
+
+
+if __name__ == "__main__":
+    main()
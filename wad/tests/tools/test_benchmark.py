@@ -0,0 +1,44 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from wad.detection import Detector
+from wad.tests.data.data_test_wad import cern_ch_test_data
+from wad.tests.data.synthetic import synthetic_pages
+from wad.tests.tools.benchmark import (regex_calls, prefilter_benchmark, read_pages, startup_benchmark,
+                                       findings_times, findings_benchmark, grouping_benchmark, CLUE_TYPES)
+
+
+def test_regex_calls():
+    calls = regex_calls(Detector(), cern_ch_test_data['geturl'], cern_ch_test_data['content'])
+    assert set(calls) == set(['url', 'html', 'script'])
+    for before, after in calls.values():
+        assert after <= before
+    # the prefilter should skip the vast majority of html clues on a typical page
+    assert calls['html'][1] * 10 < calls['html'][0]
+
+
+def test_prefilter_benchmark():
+    assert 'regex calls' in prefilter_benchmark(Detector(), read_pages([]), 1)
+
+
+def test_startup_benchmark():
+    assert 'from cache' in startup_benchmark(1)
+
+
+def test_synthetic_pages():
+    pages = synthetic_pages([1000, 5000])
+    assert [name for name, _, _, _ in pages] == ['synthetic 1000 bytes', 'synthetic 5000 bytes']
+    assert 5000 <= len(pages[1][3]) < 6000
+    assert pages == synthetic_pages([1000, 5000])
+
+
+def test_findings_benchmark():
+    pages = read_pages([]) + synthetic_pages([1000])
+    times = findings_times(Detector(), pages, 1)
+    assert times['pages'] == 2
+    assert times['pages_per_sec'] > 0
+    assert set(times['clue_types']) == set(CLUE_TYPES + ['other'])
+    assert 'pages/s' in findings_benchmark(Detector(), pages, 1)
+
+
+def test_grouping_benchmark():
+    assert 'Grouping 100 URLs' in grouping_benchmark([100], 1)
@@ -0,0 +1,92 @@
+# Time spent in each phase of scanning a page
+#
+# A timing is a dict of phase -> seconds, e.g. {'dns': 0.002, 'connect': 0.011, ..., 'total': 0.351};
+# phases which didn't happen (e.g. 'tls' for plain HTTP, or 'dns' for a reused connection) are missing.
+from __future__ import absolute_import, division, print_function, unicode_literals
+import six
+
+import contextlib
+import timeit
+
+# in the order in which they happen
+PHASES = [
+    'dns', 'connect', 'tls', 'ttfb',  # of connections from wad.pool only (summed over redirections)
+    'fetch',  # until headers of the final response are received (including all the above)
+    'body', 'decode',
+    'matching',  # computing findings, including the phases below (not timed separately in the matching pool)
+    'parse',  # of the page into a wad.page.HtmlPage
+    'check_url', 'check_headers', 'check_cookies', 'check_meta', 'check_script', 'check_html',
+    'post_processing',  # implies, duplicates, exclusions, categories and additional checks
+    'total',
+]
+HISTOGRAM_BUCKETS = [0.001, 0.01, 0.1, 1, 10]  # upper bounds, in seconds
+
+# the most precise clock available, both on Python 2 and 3
+timer = timeit.default_timer
+
+
+def add_time(timing, phase, seconds):
+    timing[phase] = timing.get(phase, 0.0) + seconds
+
+
+@contextlib.contextmanager
+def timed(timing, phase):
+    """
+    Adds the time spent in the block to the phase of the timing; does nothing if timing is None
+    """
+    if timing is None:
+        yield
+        return
+    start = timer()
+    try:
+        yield
+    finally:
+        add_time(timing, phase, timer() - start)
+
+
+def percentile(values, p):
+    """
+    :param values: sorted list
+    """
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def histogram(values):
+    """
+    :return: numbers of values in each of HISTOGRAM_BUCKETS, and above the last one
+    """
+    counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+    for value in values:
+        i = 0
+        while i < len(HISTOGRAM_BUCKETS) and value >= HISTOGRAM_BUCKETS[i]:
+            i += 1
+        counts[i] += 1
+    return counts
+
+
+def bucket_name(seconds):
+    return "%dms" % (seconds * 1000) if seconds < 1 else "%ds" % seconds
+
+
+def summary(timings):
+    """
+    :param timings: iterable of timings
+    :return: text table with statistics (in milliseconds) and a histogram of each phase
+    """
+    values = {}
+    for timing in timings:
+        for phase, seconds in six.iteritems(timing):
+            values.setdefault(phase, []).append(seconds)
+
+    buckets = ["<" + bucket_name(bound) for bound in HISTOGRAM_BUCKETS] + [">=" + bucket_name(HISTOGRAM_BUCKETS[-1])]
+    lines = ["%-16s %7s %9s %9s %9s %9s %9s " % ('phase', 'count', 'mean', 'p50', 'p90', 'p99', 'max') +
+             " ".join("%7s" % name for name in buckets)]
+    phases = [phase for phase in PHASES if phase in values] + sorted(set(values) - set(PHASES))
+    for phase in phases:
+        phase_values = sorted(values[phase])
+        stats = [sum(phase_values) / len(phase_values)] + [percentile(phase_values, p) for p in (50, 90, 99)]
+        stats.append(phase_values[-1])
+        lines.append("%-16s %7d " % (phase, len(phase_values)) +
+                     " ".join("%9.1f" % (seconds * 1000) for seconds in stats) + " " +
+                     " ".join("%7d" % count for count in histogram(phase_values)))
+    return '\n'.join(lines)
@@ -26,9 +26,19 @@ def hash_id(x):
     return md5(("%s" % x).encode('utf-8')).hexdigest()[:8]
 
 
-def urlopen(url, timeout):
-    headers = {'User-Agent': 'Mozilla/5.0 Firefox/33.0'}
-    req = six.moves.urllib.request.Request(url, None, headers)
+HEADERS = {'User-Agent': 'Mozilla/5.0 Firefox/33.0'}
+
+
+def urlopen(url, timeout, pool=None, headers=None):
+    """
+    :param pool: optional wad.pool.ConnectionPool, for reusing connections to the same hosts
+    :param headers: optional request headers, in addition to HEADERS
+    """
+    request_headers = dict(HEADERS)
+    request_headers.update(headers or {})
+    if pool is not None:
+        return pool.urlopen(url, timeout, request_headers)
+    req = six.moves.urllib.request.Request(url, None, request_headers)
     if sys.version_info >= (2, 7, 9):
         page = six.moves.urllib.request.urlopen(req, timeout=timeout, context=ssl._create_unverified_context())
     else: